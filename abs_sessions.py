@@ -0,0 +1,151 @@
+import os
+import json
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+import strava_client
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# Audiobookshelf API credentials and server URL
+ABS_API_TOKEN = os.getenv("ABS_API_TOKEN")
+ABS_URL = os.getenv("ABS_URL")
+
+# Local copy of the listening history, next to activity_history.db
+ABS_SESSION_DB_PATH = os.getenv("ABS_SESSION_DB_PATH", "abs_sessions.db")
+ABS_SESSIONS_PER_PAGE = int(os.getenv("ABS_SESSIONS_PER_PAGE", "50"))
+
+_conn = None
+_lock = threading.RLock()
+
+# --- DATABASE ---
+def init_session_db(conn):
+    # startedAt/updatedAt are epoch milliseconds; start/end_epoch are the
+    # same instants in UTC seconds, so overlap checks are plain comparisons
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS abs_sessions (
+            id TEXT PRIMARY KEY,
+            start_epoch REAL NOT NULL,
+            end_epoch REAL NOT NULL,
+            updated_at_ms INTEGER NOT NULL,
+            raw_json TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_abs_sessions_end ON abs_sessions (end_epoch)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_abs_sessions_start ON abs_sessions (start_epoch)")
+    # Sync bookkeeping (the high-water mark of the last completed sync)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS abs_sync_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    conn.commit()
+
+def get_connection():
+    """Return the shared session cache connection (opened on first use)."""
+    global _conn
+    with _lock:
+        if _conn is None:
+            conn = sqlite3.connect(ABS_SESSION_DB_PATH, check_same_thread=False)
+            init_session_db(conn)
+            _conn = conn
+    return _conn
+
+def session_epochs(session):
+    """(start, end) in UTC epoch seconds; a session without updatedAt ends where it started."""
+    started_ms = session.get("startedAt", 0)
+    return started_ms / 1000.0, session.get("updatedAt", started_ms) / 1000.0
+
+def upsert_sessions(sessions, conn=None):
+    conn = conn or get_connection()
+    rows = []
+    for session in sessions:
+        start_epoch, end_epoch = session_epochs(session)
+        rows.append((session["id"], start_epoch, end_epoch, int(end_epoch * 1000), json.dumps(session)))
+    with _lock, conn:
+        conn.executemany("""
+            INSERT INTO abs_sessions (id, start_epoch, end_epoch, updated_at_ms, raw_json)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                start_epoch = excluded.start_epoch,
+                end_epoch = excluded.end_epoch,
+                updated_at_ms = excluded.updated_at_ms,
+                raw_json = excluded.raw_json
+        """, rows)
+    return len(rows)
+
+def get_high_water_mark(conn=None):
+    """updatedAt (ms) of the newest session as of the last sync that completed."""
+    conn = conn or get_connection()
+    row = conn.execute("SELECT value FROM abs_sync_meta WHERE key = 'high_water_mark'").fetchone()
+    return int(row[0]) if row else None
+
+def set_high_water_mark(value, conn=None):
+    conn = conn or get_connection()
+    with _lock, conn:
+        conn.execute("INSERT OR REPLACE INTO abs_sync_meta (key, value) VALUES ('high_water_mark', ?)", (str(value),))
+
+# --- SYNC ---
+def sync_sessions(conn=None):
+    """
+    Page through /api/me/listening-sessions (newest update first) until a
+    page reaches sessions last updated before the stored high-water mark,
+    and upsert what came back. A session still in progress keeps moving to
+    the front, so it is picked up again. The first run pages through the
+    whole history. The mark only moves once every page came back, so a
+    failed page is fetched again next run. Returns the number of sessions
+    fetched, or None if a request failed.
+    """
+    conn = conn or get_connection()
+    high_water_mark = get_high_water_mark(conn)
+    url = f"{ABS_URL}/api/me/listening-sessions"
+    headers = {"Authorization": f"Bearer {ABS_API_TOKEN}"}
+
+    fetched = 0
+    newest = high_water_mark
+    page = 0
+    while True:
+        params = {"itemsPerPage": ABS_SESSIONS_PER_PAGE, "page": page}
+        try:
+            response = strava_client.get_session().get(url, params=params, headers=headers, timeout=strava_client.DEFAULT_TIMEOUT)
+        except Exception as e:
+            print(f"Error fetching ABS sessions: {e}")
+            return None
+        if response.status_code != 200:
+            print("Error fetching ABS sessions:", response.status_code, response.text)
+            return None
+        data = response.json()
+        sessions = data.get("sessions", [])
+        fetched += upsert_sessions(sessions, conn)
+        for session in sessions:
+            updated_ms = int(session_epochs(session)[1] * 1000)
+            newest = updated_ms if newest is None else max(newest, updated_ms)
+
+        if not sessions or page + 1 >= data.get("numPages", 0):
+            break
+        if high_water_mark is not None and min(s.get("updatedAt", s.get("startedAt", 0)) for s in sessions) < high_water_mark:
+            break
+        page += 1
+
+    if newest is not None and newest != high_water_mark:
+        set_high_water_mark(newest, conn)
+    print(f"ABS session cache synced: {fetched} sessions fetched")
+    return fetched
+
+# --- QUERIES ---
+def find_overlapping_session(start_epoch, end_epoch, conn=None):
+    """The most recently updated cached session overlapping [start_epoch, end_epoch], or None."""
+    conn = conn or get_connection()
+    row = conn.execute(
+        "SELECT raw_json FROM abs_sessions WHERE end_epoch >= ? AND start_epoch <= ? ORDER BY updated_at_ms DESC LIMIT 1",
+        (start_epoch, end_epoch)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+def get_recent_sessions(limit=3, conn=None):
+    conn = conn or get_connection()
+    rows = conn.execute("SELECT raw_json FROM abs_sessions ORDER BY start_epoch DESC LIMIT ?", (limit,)).fetchall()
+    return [json.loads(row[0]) for row in rows]
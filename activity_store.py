@@ -0,0 +1,281 @@
+import os
+import json
+import sqlite3
+import calendar
+import threading
+import datetime
+from dotenv import load_dotenv
+
+import strava_client
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# Lives next to segment_history.db
+DB_PATH = os.getenv("ACTIVITY_DB_PATH", "activity_history.db")
+PER_PAGE = 100
+
+# Strava's `after` filters on start time, so a late upload (watch synced the
+# next morning) starts *before* the watermark. Re-fetching a short overlap
+# keeps the old 14-hour safety margin for a single small request.
+SYNC_OVERLAP_HOURS = int(os.getenv("ACTIVITY_SYNC_OVERLAP_HOURS", "14"))
+
+# sync_state key holding the newest start time seen by a list sync. Single
+# activities stored by push or by ID never move it, so an activity uploaded
+# in between is still picked up by the next list sync.
+WATERMARK_KEY = "list_sync_watermark"
+
+# Detail-only keys that are never needed for history lookups
+HEAVY_KEYS = {"segment_efforts", "splits_metric", "splits_standard", "laps", "best_efforts", "photos", "similar_activities"}
+
+_conn = None
+_synced = False
+# Batch workers record GPX exports while the main thread applies renames;
+# writes on the shared connection take turns
+_lock = threading.RLock()
+
+# --- DATABASE ---
+def init_activity_db(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activities (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            activity_type TEXT,
+            start_date TEXT NOT NULL,
+            start_epoch INTEGER NOT NULL,
+            raw_json TEXT NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_activities_type_start ON activities (activity_type, start_epoch)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_activities_start ON activities (start_epoch)")
+    # One row per streak kind ("run", "ride"). last_period is the local date
+    # of the last counted run, or the Monday of the last counted ride's week.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS streak_state (
+            kind TEXT PRIMARY KEY,
+            last_counter INTEGER NOT NULL,
+            last_period TEXT NOT NULL,
+            activity_id INTEGER NOT NULL,
+            big_loops INTEGER,
+            small_loops INTEGER,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Hash of what each exported GPX was built from, to skip unchanged rewrites
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS gpx_exports (
+            activity_id INTEGER PRIMARY KEY,
+            source_hash TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            exported_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Small key/value table for sync bookkeeping (backfill checkpoints)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    conn.commit()
+
+def get_connection():
+    """Return the shared store connection (opened on first use)."""
+    global _conn
+    with _lock:
+        if _conn is None:
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+            init_activity_db(conn)
+            _conn = conn
+    return _conn
+
+def parse_start_epoch(start_date):
+    dt = datetime.datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%SZ")
+    return calendar.timegm(dt.timetuple())
+
+def _upsert_rows(conn, activities):
+    rows = []
+    for act in activities:
+        summary = {k: v for k, v in act.items() if k not in HEAVY_KEYS}
+        rows.append((
+            act["id"],
+            act.get("name", ""),
+            act.get("type", "").lower(),
+            act["start_date"],
+            parse_start_epoch(act["start_date"]),
+            json.dumps(summary),
+        ))
+    conn.executemany("""
+        INSERT INTO activities (id, name, activity_type, start_date, start_epoch, raw_json)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name,
+            activity_type = excluded.activity_type,
+            start_date = excluded.start_date,
+            start_epoch = excluded.start_epoch,
+            raw_json = excluded.raw_json,
+            updated_at = CURRENT_TIMESTAMP
+    """, rows)
+    return len(rows)
+
+def upsert_activities(activities, conn=None):
+    conn = conn or get_connection()
+    with _lock, conn:
+        return _upsert_rows(conn, activities)
+
+def get_sync_value(key, conn=None):
+    conn = conn or get_connection()
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_sync_value(key, value, conn=None):
+    conn = conn or get_connection()
+    with _lock, conn:
+        if value is None:
+            conn.execute("DELETE FROM sync_state WHERE key = ?", (key,))
+        else:
+            conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+def mark_synced():
+    global _synced
+    _synced = True
+
+def get_watermark(conn=None):
+    value = get_sync_value(WATERMARK_KEY, conn)
+    return int(value) if value is not None else None
+
+# --- SYNC ---
+def sync_activities(conn=None):
+    """
+    Fetch activities newer than the list-sync watermark and upsert them.
+    Without a watermark the store is seeded with the latest page (the depth
+    the streak engines used to download on every call). Returns the fetched summaries,
+    or None if the API call failed.
+    """
+    global _synced
+    conn = conn or get_connection()
+    watermark = get_watermark(conn)
+    after = watermark - SYNC_OVERLAP_HOURS * 3600 if watermark is not None else None
+
+    fetched = []
+    page = 1
+    while True:
+        params = {"per_page": PER_PAGE, "page": page}
+        if after is not None:
+            params["after"] = after
+        response = strava_client.get("/athlete/activities", params=params)
+        if response.status_code != 200:
+            print(f"Error syncing activities: {response.status_code}, {response.text}")
+            return None
+        batch = response.json()
+        upsert_activities(batch, conn)
+        fetched.extend(batch)
+        if after is None or len(batch) < PER_PAGE:
+            break
+        page += 1
+
+    newest = max((parse_start_epoch(a["start_date"]) for a in fetched), default=None)
+    if newest is not None and (watermark is None or newest > watermark):
+        set_sync_value(WATERMARK_KEY, newest, conn)
+    _synced = True
+    print(f"Activity store synced: {len(fetched)} activities fetched")
+    return fetched
+
+def ensure_synced():
+    if not _synced:
+        sync_activities()
+
+# --- QUERIES ---
+def _rows_to_activities(rows):
+    activities = []
+    for name, raw_json in rows:
+        act = json.loads(raw_json)
+        act["name"] = name
+        activities.append(act)
+    return activities
+
+def get_activities_since(start_epoch, end_epoch=None, conn=None):
+    """Stored activities starting at or after `start_epoch` (and before `end_epoch`), oldest first."""
+    conn = conn or get_connection()
+    rows = conn.execute(
+        "SELECT name, raw_json FROM activities WHERE start_epoch >= ? AND start_epoch < ? ORDER BY start_epoch ASC",
+        (start_epoch, end_epoch if end_epoch is not None else 2 ** 62)
+    ).fetchall()
+    return _rows_to_activities(rows)
+
+def get_history(activity_types, conn=None):
+    """All stored activities of the given (lower-case) types, newest first."""
+    ensure_synced()
+    conn = conn or get_connection()
+    types = list(activity_types)
+    placeholders = ", ".join("?" for _ in types)
+    rows = conn.execute(
+        f"SELECT name, raw_json FROM activities WHERE activity_type IN ({placeholders}) ORDER BY start_epoch DESC",
+        types
+    ).fetchall()
+    return _rows_to_activities(rows)
+
+# --- STREAK STATE ---
+def get_streak_state(kind, conn=None):
+    conn = conn or get_connection()
+    row = conn.execute(
+        "SELECT last_counter, last_period, activity_id, big_loops, small_loops FROM streak_state WHERE kind = ?",
+        (kind,)
+    ).fetchone()
+    if not row:
+        return None
+    return {
+        "kind": kind,
+        "last_counter": row[0],
+        "last_period": row[1],
+        "activity_id": row[2],
+        "big_loops": row[3],
+        "small_loops": row[4],
+    }
+
+def _save_state_row(conn, kind, counter, period, activity_id, big_loops, small_loops):
+    conn.execute("""
+        INSERT INTO streak_state (kind, last_counter, last_period, activity_id, big_loops, small_loops)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(kind) DO UPDATE SET
+            last_counter = excluded.last_counter,
+            last_period = excluded.last_period,
+            activity_id = excluded.activity_id,
+            big_loops = excluded.big_loops,
+            small_loops = excluded.small_loops,
+            updated_at = CURRENT_TIMESTAMP
+    """, (kind, counter, period, activity_id, big_loops, small_loops))
+
+def save_streak_state(kind, counter, period, activity_id, big_loops=None, small_loops=None, conn=None):
+    conn = conn or get_connection()
+    with _lock, conn:
+        _save_state_row(conn, kind, counter, period, activity_id, big_loops, small_loops)
+    return get_streak_state(kind, conn)
+
+def clear_streak_state(kind, conn=None):
+    conn = conn or get_connection()
+    with _lock, conn:
+        conn.execute("DELETE FROM streak_state WHERE kind = ?", (kind,))
+
+def record_streak_rename(kind, activity, counter, period, big_loops=None, small_loops=None, conn=None):
+    """Store a renamed activity and advance its streak state in one transaction."""
+    conn = conn or get_connection()
+    with _lock, conn:
+        _upsert_rows(conn, [activity])
+        _save_state_row(conn, kind, counter, period, activity["id"], big_loops, small_loops)
+
+# --- GPX EXPORT INDEX ---
+def get_export_hash(activity_id, conn=None):
+    conn = conn or get_connection()
+    with _lock:
+        row = conn.execute("SELECT source_hash FROM gpx_exports WHERE activity_id = ?", (activity_id,)).fetchone()
+    return row[0] if row else None
+
+def record_export(activity_id, source_hash, file_path, conn=None):
+    conn = conn or get_connection()
+    with _lock, conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO gpx_exports (activity_id, source_hash, file_path, exported_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        """, (activity_id, source_hash, file_path))
@@ -0,0 +1,111 @@
+import os
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+
+import strava_client
+import activity_store
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "4"))
+PER_PAGE = 200  # the largest page Strava serves
+
+# Checkpoint keys in the activity store's sync_state table
+CHECKPOINT_PAGE = "backfill_page"
+CHECKPOINT_BEFORE = "backfill_before"
+
+def estimate_pages():
+    """Page count from the athlete's lifetime totals (runs + rides + swims; a lower bound)."""
+    response = strava_client.get("/athlete")
+    if response.status_code != 200:
+        return None
+    athlete_id = response.json().get("id")
+    response = strava_client.get(f"/athletes/{athlete_id}/stats")
+    if response.status_code != 200:
+        return None
+    stats = response.json()
+    total = sum(stats.get(key, {}).get("count", 0) for key in ("all_run_totals", "all_ride_totals", "all_swim_totals"))
+    return math.ceil(total / PER_PAGE)
+
+def fetch_page(page, before):
+    params = {"per_page": PER_PAGE, "page": page, "before": before}
+    response = strava_client.get("/athlete/activities", params=params, priority=strava_client.PRIORITY_LOW)
+    if response.status_code != 200:
+        raise RuntimeError(f"page {page}: {response.status_code}, {response.text}")
+    return response.json()
+
+def backfill_history(workers=BACKFILL_WORKERS, restart=False):
+    """
+    Page through the whole activity list with `workers` requests in flight
+    and upsert every page into the activity store as it arrives. Pages are
+    pinned with `before=<start of the first attempt>` so new uploads don't
+    shift them, and the last contiguous completed page is checkpointed so
+    an interrupted run resumes where it stopped. Pacing is left to the
+    client's rate limiter. Returns the number of activities stored, or None
+    if a page failed.
+    """
+    if restart:
+        activity_store.set_sync_value(CHECKPOINT_PAGE, None)
+        activity_store.set_sync_value(CHECKPOINT_BEFORE, None)
+
+    before = activity_store.get_sync_value(CHECKPOINT_BEFORE)
+    if before is None:
+        before = int(time.time())
+        activity_store.set_sync_value(CHECKPOINT_BEFORE, before)
+    before = int(before)
+    done_page = int(activity_store.get_sync_value(CHECKPOINT_PAGE) or 0)
+    if done_page:
+        print(f"Resuming backfill after page {done_page}")
+
+    estimate = estimate_pages()
+    if estimate:
+        print(f"Backfill: about {estimate} pages of {PER_PAGE}")
+
+    total = 0
+    next_page = done_page + 1
+    last_page = None  # first page that came back short
+    finished = set()
+    failed = False
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        while True:
+            while not failed and len(in_flight) < workers and (last_page is None or next_page <= last_page):
+                in_flight[pool.submit(fetch_page, next_page, before)] = next_page
+                next_page += 1
+            if not in_flight:
+                break
+
+            completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in completed:
+                page = in_flight.pop(future)
+                try:
+                    batch = future.result()
+                except Exception as e:
+                    print(f"Backfill failed on {e}")
+                    failed = True
+                    continue
+                total += activity_store.upsert_activities(batch)
+                if len(batch) < PER_PAGE and (last_page is None or page < last_page):
+                    last_page = page
+                finished.add(page)
+
+            # Checkpoint only the contiguous prefix, so nothing is skipped on resume
+            while done_page + 1 in finished:
+                done_page += 1
+                finished.discard(done_page)
+            activity_store.set_sync_value(CHECKPOINT_PAGE, done_page)
+            print(f"Backfill: {done_page} pages done, {total} activities")
+
+    if failed:
+        return None
+
+    activity_store.set_sync_value(CHECKPOINT_PAGE, None)
+    activity_store.set_sync_value(CHECKPOINT_BEFORE, None)
+    # Anything uploaded since the backfill started
+    activity_store.sync_activities()
+    activity_store.mark_synced()
+    print(f"Backfill complete: {total} activities")
+    return total
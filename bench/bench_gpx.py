@@ -0,0 +1,105 @@
+"""
+Compare the streaming GPX writer with the previous ElementTree builder.
+
+    python bench/bench_gpx.py [points ...]
+
+Reports wall time and peak traced memory for each size and checks that
+both produce identical output, then times Streams timestamp generation
+per point against gpx_writer.stream_timestamps.
+"""
+import os
+import io
+import sys
+import time
+import random
+import datetime
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gpx_writer
+
+START = datetime.datetime(2026, 5, 1, 6, 30, 0)
+ELAPSED = 4 * 3600 + 17
+
+def make_points(count):
+    rng = random.Random(count)
+    lat, lon = 48.2082, 16.3738
+    points = []
+    for _ in range(count):
+        lat = round(lat + rng.uniform(-1e-4, 1e-4), 5)
+        lon = round(lon + rng.uniform(-1e-4, 1e-4), 5)
+        points.append((lat, lon))
+    return points
+
+def build_elementtree(points, name):
+    # The generate_gpx implementation this writer replaced
+    gpx = ET.Element("gpx", version="1.1", creator="StravaGPXExporter", xmlns="http://www.topografix.com/GPX/1/1")
+    trk = ET.SubElement(gpx, "trk")
+    ET.SubElement(trk, "name").text = name
+    trkseg = ET.SubElement(trk, "trkseg")
+    for i, (lat, lon) in enumerate(points):
+        timestamp = START + datetime.timedelta(seconds=i * (ELAPSED / len(points)))
+        trkpt = ET.SubElement(trkseg, "trkpt", lat=str(lat), lon=str(lon))
+        ET.SubElement(trkpt, "time").text = timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return ET.tostring(gpx, encoding="utf-8").decode("utf-8")
+
+def build_streaming(points, name):
+    out = io.StringIO()
+    times = gpx_writer.spread_timestamps(START, ELAPSED, len(points))
+    gpx_writer.write_gpx(out, name, ((lat, lon, t) for (lat, lon), t in zip(points, times)))
+    return out.getvalue()
+
+def stream_to_devnull(points, name):
+    # What save_gpx does: nothing is held in memory but the current point
+    with open(os.devnull, "w") as out:
+        times = gpx_writer.spread_timestamps(START, ELAPSED, len(points))
+        gpx_writer.write_gpx(out, name, ((lat, lon, t) for (lat, lon), t in zip(points, times)))
+
+def stream_timestamps_per_point(start_epoch, offsets):
+    # One datetime + timedelta + strftime per point
+    start = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=start_epoch)
+    return [(start + datetime.timedelta(seconds=o)).strftime("%Y-%m-%dT%H:%M:%SZ") for o in offsets]
+
+def bench_stream_timestamps(sizes):
+    from array import array
+    start_epoch = int(START.replace(tzinfo=datetime.timezone.utc).timestamp())
+    backend = "numpy" if gpx_writer.np is not None else "pure python"
+    print(f"\nStreams timestamps ({backend})")
+    print(f"{'points':>8} {'per-point':>10} {'vectorized':>11}")
+    for size in sizes:
+        offsets = array("q", range(size))
+        t0 = time.perf_counter()
+        old = stream_timestamps_per_point(start_epoch, offsets)
+        t1 = time.perf_counter()
+        new = gpx_writer.stream_timestamps(start_epoch, offsets)
+        t2 = time.perf_counter()
+        assert old == list(new), f"timestamps differ at {size} points"
+        print(f"{size:>8} {t1 - t0:>10.3f} {t2 - t1:>11.3f}")
+
+def measure(func, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 100000]
+    name = "#042 Morning Ride & <test>"
+    print(f"{'points':>8} {'impl':>14} {'seconds':>9} {'peak MiB':>9}")
+    for size in sizes:
+        points = make_points(size)
+        old, old_t, old_peak = measure(build_elementtree, points, name)
+        new, new_t, new_peak = measure(build_streaming, points, name)
+        _, file_t, file_peak = measure(stream_to_devnull, points, name)
+        assert old == new, f"output differs at {size} points"
+        print(f"{size:>8} {'elementtree':>14} {old_t:>9.3f} {old_peak / 2**20:>9.2f}")
+        print(f"{size:>8} {'stream (str)':>14} {new_t:>9.3f} {new_peak / 2**20:>9.2f}")
+        print(f"{size:>8} {'stream (file)':>14} {file_t:>9.3f} {file_peak / 2**20:>9.2f}")
+    bench_stream_timestamps(sizes)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare polyline.decode (one call per polyline, list of tuples) with
+polyline_batch.decode_many over a batch of synthetic activity polylines.
+
+    python bench/bench_polyline.py [polylines] [points_per_polyline]
+
+Checks that both decoders agree exactly and reports seconds per million
+decoded points.
+"""
+import os
+import sys
+import time
+import random
+
+import polyline
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import polyline_batch
+
+def make_polylines(count, points):
+    rng = random.Random(count * points)
+    encoded = []
+    for _ in range(count):
+        lat, lon = 48.2 + rng.uniform(-1, 1), 16.4 + rng.uniform(-1, 1)
+        track = []
+        for _ in range(rng.randint(points // 2, points * 3 // 2)):
+            lat += rng.uniform(-1e-3, 1e-3)
+            lon += rng.uniform(-1e-3, 1e-3)
+            track.append((lat, lon))
+        encoded.append(polyline.encode(track))
+    return encoded
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    points = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    encoded = make_polylines(count, points)
+
+    t0 = time.perf_counter()
+    expected = [polyline.decode(e) for e in encoded]
+    reference = time.perf_counter() - t0
+    total = sum(len(e) for e in expected)
+
+    t0 = time.perf_counter()
+    lats, lons, offsets = polyline_batch.decode_many(encoded)
+    batch = time.perf_counter() - t0
+
+    lats, lons = polyline_batch.as_floats(lats), polyline_batch.as_floats(lons)
+    for i, points_i in enumerate(expected):
+        start, end = offsets[i], offsets[i + 1]
+        assert points_i == list(zip(lats[start:end], lons[start:end])), f"polyline {i} differs"
+
+    backend = "numpy" if polyline_batch.np is not None else "pure python"
+    per_million = 1e6 / total
+    print(f"{count} polylines, {total} points ({backend})")
+    print(f"polyline.decode      {reference:8.3f}s  {reference * per_million:8.3f}s per 1M points")
+    print(f"decode_many          {batch:8.3f}s  {batch * per_million:8.3f}s per 1M points")
+    print(f"speedup              {reference / batch:8.1f}x")
+
+if __name__ == "__main__":
+    main()
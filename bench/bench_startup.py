@@ -0,0 +1,95 @@
+"""
+Cold-start cost of each CLI subcommand: a fresh interpreter per run, timed
+from process launch until the command's first Strava API request (which is
+intercepted, so nothing goes over the network).
+
+    python bench/bench_startup.py [runs]
+
+Reports the median wall time per subcommand, the part spent inside Python
+after interpreter startup, and how many modules were loaded.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# A command that never reaches its first request must not hang the bench
+RUN_TIMEOUT = 60
+
+# (label, script module, argv)
+COMMANDS = [
+    ("import strava", "strava", None),
+    ("<activity id>", "strava", ["123"]),
+    ("(recent)", "strava", []),
+    ("--segment", "strava", ["--segment", "1"]),
+    ("--monitor", "strava", ["--monitor", "1"]),
+    ("--segment-stats", "strava", ["--segment-stats", "1"]),
+    ("--export", "strava", ["--export", "out.gpx"]),
+    ("strava_abs", "strava_abs", []),
+]
+
+DRIVER = """
+import sys, time, json
+t0 = time.perf_counter()
+import strava_client
+
+class FirstRequest(Exception):
+    pass
+
+def first_request(*args, **kwargs):
+    raise FirstRequest()
+
+strava_client.request = first_request
+module = __import__(sys.argv[1])
+argv = json.loads(sys.argv[2])
+if argv is not None:
+    try:
+        module.main(argv)
+    except FirstRequest:
+        pass
+print(json.dumps({"elapsed": time.perf_counter() - t0, "modules": len(sys.modules)}))
+"""
+
+def run_once(module, argv, env, cwd):
+    t0 = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", DRIVER, module, json.dumps(argv)],
+        env=env, cwd=cwd, capture_output=True, text=True, check=True, timeout=RUN_TIMEOUT
+    )
+    wall = time.perf_counter() - t0
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    return wall, stats["elapsed"], stats["modules"]
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT,
+        "SAVE_PATH": workdir,
+        "STRAVA_TOKEN_PATH": os.path.join(workdir, "token.json"),
+        "ACTIVITY_DB_PATH": os.path.join(workdir, "activity_history.db"),
+        "SEGMENT_DB_PATH": os.path.join(workdir, "segment_history.db"),
+        "HTTP_CACHE_PATH": os.path.join(workdir, "http_cache.db"),
+    })
+
+    baseline = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+        baseline.append(time.perf_counter() - t0)
+    baseline = statistics.median(baseline)
+    print(f"{runs} runs each, interpreter baseline {baseline * 1000:.1f} ms")
+    print(f"{'command':<18} {'wall ms':>8} {'python ms':>10} {'modules':>8}")
+    for label, module, argv in COMMANDS:
+        samples = [run_once(module, argv, env, workdir) for _ in range(runs)]
+        wall = statistics.median(s[0] for s in samples)
+        inner = statistics.median(s[1] for s in samples)
+        print(f"{label:<18} {wall * 1000:8.1f} {inner * 1000:10.1f} {samples[-1][2]:8d}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+End-to-end throughput of strava.py against the local fake Strava API
+(bench/fake_strava.py): no network, no real quota.
+
+    python bench/bench_throughput.py [activities] [latency_ms] [rate_401] [rate_429]
+
+Scenarios:
+  cron      strava.main([]) repeatedly (first run seeds the store)
+  batch     process_batch over chunks of historical activities
+  single    process_activity one by one
+  segment   segment_monitor.record_segment_efforts
+
+For each it reports activities (or polls) per second, API calls per
+activity and p50/p99 latency per run. Defaults: 300 activities, 20 ms
+server latency, 1% injected 401s and 1% 429s (each 429 costs a 1 s
+Retry-After, so p99 shows the retry path).
+"""
+import io
+import os
+import sys
+import time
+import tempfile
+import contextlib
+from collections import Counter
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH))
+sys.path.insert(0, BENCH)
+import fake_strava
+
+BATCH_SIZE = 50
+SINGLE_RUNS = 50
+CRON_RUNS = 5
+SEGMENT_POLLS = 50
+RECENT_ACTIVITIES = 5
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def report(label, latencies, items, server, endpoints):
+    calls = server.total_calls()
+    endpoints.update(server.calls)
+    server.reset_calls()
+    total = sum(latencies)
+    print(f"{label:<8} {len(latencies):5d} {items:7d} {items / total:9.1f} {calls / max(1, items):10.2f} "
+          f"{percentile(latencies, 50) * 1000:9.1f} {percentile(latencies, 99) * 1000:9.1f}")
+
+def timed(func, *args):
+    # The scripts print per activity; keep that out of the measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - t0
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.02
+    rate_401 = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+    rate_429 = float(sys.argv[4]) if len(sys.argv) > 4 else 0.01
+
+    # Configuration is read at import, so the environment comes first
+    workdir = tempfile.mkdtemp(prefix="bench_throughput_")
+    os.environ.update({
+        "SAVE_PATH": os.path.join(workdir, "gpx"),
+        "STRAVA_TOKEN_PATH": os.path.join(workdir, "token.json"),
+        "STRAVA_ACCESS_TOKEN": "fake-token-0",
+        "STRAVA_REFRESH_TOKEN": "fake-refresh-0",
+        "STRAVA_TOKEN_EXPIRES_AT": str(int(time.time()) + 6 * 3600),
+        "ACTIVITY_DB_PATH": os.path.join(workdir, "activity_history.db"),
+        "SEGMENT_DB_PATH": os.path.join(workdir, "segment_history.db"),
+        "HTTP_CACHE_PATH": os.path.join(workdir, "http_cache.db"),
+        "WEBHOOK_URL": "",
+    })
+
+    history = fake_strava.make_history(count, first_id=10 ** 9)
+    recent = fake_strava.make_history(RECENT_ACTIVITIES, days=0.5, seed=2, first_id=2 * 10 ** 9, counters=False)
+    server = fake_strava.FakeStrava(history + recent, latency=latency, rate_401=rate_401, rate_429=rate_429)
+    base = server.start()
+    endpoints = Counter()
+
+    import strava_client
+    strava_client.API_BASE = base
+    strava_client.TOKEN_URL = f"{base}/oauth/token"
+    import strava
+    import segment_monitor
+
+    print(f"{count} activities, {latency * 1000:.0f} ms latency, {rate_401:.1%} 401s, {rate_429:.1%} 429s")
+    print(f"{'scenario':<8} {'runs':>5} {'items':>7} {'items/s':>9} {'calls/item':>10} {'p50 ms':>9} {'p99 ms':>9}")
+
+    latencies = [timed(strava.main, []) for _ in range(CRON_RUNS)]
+    report("cron", latencies, RECENT_ACTIVITIES * CRON_RUNS, server, endpoints)
+
+    ids = [str(a["id"]) for a in history]
+    batch_ids = ids[:count - SINGLE_RUNS]
+    latencies = [timed(strava.process_batch, batch_ids[i:i + BATCH_SIZE]) for i in range(0, len(batch_ids), BATCH_SIZE)]
+    report("batch", latencies, len(batch_ids), server, endpoints)
+
+    single_ids = ids[count - SINGLE_RUNS:]
+    latencies = [timed(strava.process_activity, activity_id) for activity_id in single_ids]
+    report("single", latencies, len(single_ids), server, endpoints)
+
+    latencies = [timed(segment_monitor.record_segment_efforts, strava.BIG_SEGMENT_ID) for _ in range(SEGMENT_POLLS)]
+    report("segment", latencies, SEGMENT_POLLS, server, endpoints)
+
+    server.stop()
+    print("calls by endpoint:")
+    for endpoint, calls in endpoints.most_common():
+        print(f"  {endpoint:<32} {calls:6d}")
+
+if __name__ == "__main__":
+    main()
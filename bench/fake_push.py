@@ -0,0 +1,112 @@
+"""
+Local stand-in for Strava's push side: validates a subscription callback
+and posts activity events to it, so push_receiver.py can be exercised
+without a public URL.
+
+    python bench/fake_push.py                              # self-check
+    python bench/fake_push.py <callback_url> <activity_id> [create|update]
+
+The self-check starts push_receiver.make_server on a free port and checks:
+- the hub.challenge echo, and the 403 for a wrong verify token
+- that create/update events are acknowledged
+- that duplicate IDs are coalesced
+- that the handler sees the activities in arrival order, with updates
+  invalidating the cached details
+It exits non-zero on the first mismatch.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH))
+
+VERIFY_TOKEN = "fake-verify-token"
+
+# --- CLIENT ---
+def validate(callback_url, verify_token, challenge="fake-challenge"):
+    """The GET Strava sends when a subscription is created; returns (status, body)."""
+    query = urllib.parse.urlencode({"hub.mode": "subscribe", "hub.challenge": challenge, "hub.verify_token": verify_token})
+    try:
+        with urllib.request.urlopen(f"{callback_url}?{query}", timeout=5) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+def post_event(callback_url, object_id, aspect_type="create", object_type="activity", owner_id=42):
+    """POST one event shaped like Strava's; returns the HTTP status."""
+    event = {
+        "object_type": object_type, "object_id": object_id, "aspect_type": aspect_type,
+        "owner_id": owner_id, "subscription_id": 1, "event_time": int(time.time()), "updates": {},
+    }
+    request = urllib.request.Request(
+        callback_url, data=json.dumps(event).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+# --- SELF-CHECK ---
+def check(label, actual, expected):
+    if actual != expected:
+        print(f"FAIL {label}: expected {expected!r}, got {actual!r}")
+        sys.exit(1)
+    print(f"ok   {label}")
+
+def self_check():
+    workdir = tempfile.mkdtemp(prefix="fake_push_")
+    os.environ.update({
+        "HTTP_CACHE_PATH": os.path.join(workdir, "http_cache.db"),
+        "STRAVA_TOKEN_PATH": os.path.join(workdir, "token.json"),
+    })
+    import push_receiver
+    import response_cache
+
+    handled = []
+    invalidated = []
+    response_cache.invalidate = lambda url: invalidated.append(url.rsplit("/", 1)[-1])
+
+    server, work_queue, worker = push_receiver.make_server(handled.append, host="127.0.0.1", port=0, verify_token=VERIFY_TOKEN)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+
+    check("challenge echoed", validate(url, VERIFY_TOKEN, "abc123"), (200, {"hub.challenge": "abc123"}))
+    check("bad verify token rejected", validate(url, "wrong")[0], 403)
+
+    # The worker starts only after everything is queued, so coalescing is deterministic
+    events = [(101, "create"), (101, "update"), (102, "create"), (101, "create"), (103, "update"), (102, "create")]
+    statuses = [post_event(url, object_id, aspect) for object_id, aspect in events]
+    statuses.append(post_event(url, 104, "delete"))
+    statuses.append(post_event(url, 42, "update", object_type="athlete"))
+    check("events acknowledged", statuses, [200] * len(statuses))
+
+    # Replies go out before handle_event runs; server_close() waits for the
+    # request threads, so every event is queued before the worker drains
+    server.shutdown()
+    server.server_close()
+    worker.start()
+    work_queue.stop()
+    worker.join(timeout=10)
+
+    check("duplicates coalesced, handled in order", handled, ["101", "102", "103"])
+    check("updates invalidate cached details", invalidated, ["101", "103"])
+
+def main():
+    if len(sys.argv) < 3:
+        self_check()
+        return
+    callback_url, object_id = sys.argv[1], int(sys.argv[2])
+    aspect_type = sys.argv[3] if len(sys.argv) > 3 else "create"
+    print(f"POST {aspect_type} {object_id} -> {post_event(callback_url, object_id, aspect_type)}")
+
+if __name__ == "__main__":
+    main()
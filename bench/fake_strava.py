@@ -0,0 +1,291 @@
+"""
+Local stand-in for the Strava API, for load tests and benchmarks that must
+not spend real quota.
+
+    python bench/fake_strava.py [port] [activities]
+
+Serves a synthetic activity history (list/detail/streams/update), athlete
+stats, segments and OAuth refresh over keep-alive HTTP/1.1. Latency, 401s
+(the current access token is revoked, forcing a refresh) and 429s (with
+Retry-After) can be injected. Every request is counted in `calls`.
+
+From Python:
+
+    server = FakeStrava(make_history(500), latency=0.02, rate_429=0.01)
+    base = server.start()      # point strava_client.API_BASE/TOKEN_URL here
+    ...
+    server.stop()
+"""
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import calendar
+import datetime
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+import polyline
+
+# Segment IDs the cycle streak engine looks for (strava.BIG/SMALL_SEGMENT_ID)
+BIG_SEGMENT_ID = 10792500
+SMALL_SEGMENT_ID = 2517149
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+ACTIVITY_TYPES = ["Run", "Run", "Ride", "Ride", "Walk", "NordicSki"]
+
+# --- SYNTHETIC DATA ---
+def make_track(rng, points):
+    lat, lon = 48.2 + rng.uniform(-0.2, 0.2), 16.37 + rng.uniform(-0.2, 0.2)
+    track = []
+    for _ in range(points):
+        lat += rng.uniform(-4e-4, 4e-4)
+        lon += rng.uniform(-4e-4, 4e-4)
+        track.append((round(lat, 5), round(lon, 5)))
+    return track
+
+def make_history(count, days=None, end=None, seed=1, points=300, first_id=10 ** 9, counters=True):
+    """
+    `count` detailed activities, newest first, spread evenly over `days`
+    (default: one per day) and ending at `end` (default: now). IDs count
+    up from `first_id` (oldest). Rides carry segment efforts on the streak
+    segments. With `counters`, runs and rides are already named "#NNN ..."
+    like a history the streak engines have been through.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.datetime.utcnow()
+    span = datetime.timedelta(days=days or count)
+    activities = []
+    for i in range(count):
+        start = end - span * (i + 1) / count
+        activity_type = rng.choice(ACTIVITY_TYPES)
+        track = make_track(rng, rng.randint(points // 2, points * 3 // 2))
+        efforts = []
+        if activity_type == "Ride":
+            for _ in range(rng.randint(0, 4)):
+                efforts.append({"segment": {"id": BIG_SEGMENT_ID, "name": "Big loop"}, "elapsed_time": rng.randint(600, 900)})
+            for _ in range(rng.randint(0, 2)):
+                efforts.append({"segment": {"id": SMALL_SEGMENT_ID, "name": "Small loop"}, "elapsed_time": rng.randint(200, 400)})
+            for _ in range(rng.randint(5, 30)):
+                efforts.append({"segment": {"id": rng.randint(1, 10 ** 7), "name": "Other"}, "elapsed_time": rng.randint(30, 900)})
+        activities.append({
+            "id": first_id + count - 1 - i,
+            "name": f"{activity_type} {i}",
+            "type": activity_type,
+            "start_date": start.strftime(TIME_FORMAT),
+            "timezone": "(GMT+01:00) Europe/Vienna",
+            "elapsed_time": rng.randint(900, 3 * 3600),
+            "distance": round(rng.uniform(2000, 80000), 1),
+            "description": "",
+            "map": {"summary_polyline": polyline.encode(track)},
+            "segment_efforts": efforts,
+            "laps": [{"lap_index": n, "elapsed_time": rng.randint(200, 400)} for n in range(rng.randint(1, 20))],
+        })
+    if counters:
+        numbers = Counter()
+        for activity in reversed(activities):
+            kind = "ride" if activity["type"] == "Ride" else "run" if activity["type"] in ("Run", "NordicSki") else None
+            if kind:
+                numbers[kind] += 1
+                activity["name"] = f"#{numbers[kind]:03d} {activity['name']}"
+    return activities
+
+def _epoch(start_date):
+    return calendar.timegm(time.strptime(start_date, TIME_FORMAT))
+
+# --- SERVER ---
+class FakeStrava:
+    def __init__(self, activities=(), latency=0.0, rate_401=0.0, rate_429=0.0, seed=1,
+                 short_limit=100000, long_limit=1000000):
+        self.activities = {a["id"]: dict(a) for a in activities}
+        self.latency = latency
+        self.rate_401 = rate_401
+        self.rate_429 = rate_429
+        self.short_limit = short_limit
+        self.long_limit = long_limit
+        self.calls = Counter()
+        self.segment_efforts = Counter()
+        self.access_token = "fake-token-0"
+        self._refreshes = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    # --- lifecycle ---
+    def start(self, host="127.0.0.1", port=0):
+        """Serve on a background thread; returns the API base URL."""
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-strava", daemon=True).start()
+        return self.base_url
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    # --- fault injection ---
+    def _roll(self, rate):
+        with self._lock:
+            return rate > 0 and self._rng.random() < rate
+
+    def revoke_token(self):
+        with self._lock:
+            self.access_token = f"fake-token-revoked-{self._refreshes}"
+
+    # --- API ---
+    def summary(self, activity):
+        return {k: v for k, v in activity.items() if k not in ("segment_efforts", "laps", "description")}
+
+    def list_activities(self, query):
+        activities = sorted(self.activities.values(), key=lambda a: _epoch(a["start_date"]), reverse=True)
+        if "after" in query:
+            # Strava returns `after` queries oldest first
+            activities = [a for a in reversed(activities) if _epoch(a["start_date"]) > float(query["after"])]
+        if "before" in query:
+            activities = [a for a in activities if _epoch(a["start_date"]) < float(query["before"])]
+        per_page = int(query.get("per_page", 30))
+        page = int(query.get("page", 1))
+        return [self.summary(a) for a in activities[(page - 1) * per_page:page * per_page]]
+
+    def streams(self, activity):
+        track = polyline.decode(activity["map"]["summary_polyline"])
+        step = activity["elapsed_time"] / max(1, len(track))
+        return {
+            "latlng": {"data": [list(p) for p in track]},
+            "time": {"data": [int(i * step) for i in range(len(track))]},
+            "altitude": {"data": [200.0 + (i % 50) for i in range(len(track))]},
+        }
+
+    def athlete_stats(self):
+        counts = Counter(a["type"] for a in self.activities.values())
+        return {
+            "all_run_totals": {"count": counts["Run"]},
+            "all_ride_totals": {"count": counts["Ride"]},
+            "all_swim_totals": {"count": 0},
+        }
+
+    def segment(self, segment_id):
+        with self._lock:
+            # A few new efforts every poll
+            self.segment_efforts[segment_id] += self._rng.randint(0, 5)
+            efforts = self.segment_efforts[segment_id]
+        return {"id": segment_id, "name": f"Segment {segment_id}", "effort_count": 10000 + efforts, "athlete_count": 2000 + efforts // 3}
+
+    def refresh(self):
+        with self._lock:
+            self._refreshes += 1
+            self.access_token = f"fake-token-{self._refreshes}"
+            return {
+                "access_token": self.access_token,
+                "refresh_token": f"fake-refresh-{self._refreshes}",
+                "expires_at": int(time.time()) + 6 * 3600,
+            }
+
+def _make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body=None, headers=None):
+            data = b"" if body is None else json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            usage = fake.total_calls()
+            self.send_header("X-RateLimit-Limit", f"{fake.short_limit},{fake.long_limit}")
+            self.send_header("X-RateLimit-Usage", f"{usage % fake.short_limit},{usage % fake.long_limit}")
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return dict(parse_qsl(self.rfile.read(length).decode("utf-8"))) if length else {}
+
+        def _route(self, method):
+            url = urlparse(self.path)
+            query = dict(parse_qsl(url.query))
+            body = self._body() if method in ("PUT", "POST") else {}
+            route = re.sub(r"/\d+", "/{id}", url.path)
+            with fake._lock:
+                fake.calls[f"{method} {route}"] += 1
+            if fake.latency:
+                time.sleep(fake.latency)
+
+            if method == "POST" and url.path == "/oauth/token":
+                return self._send(200, fake.refresh())
+            if fake._roll(fake.rate_401):
+                fake.revoke_token()
+            if self.headers.get("Authorization") != f"Bearer {fake.access_token}":
+                return self._send(401, {"message": "Authorization Error"})
+            if fake._roll(fake.rate_429):
+                return self._send(429, {"message": "Rate Limit Exceeded"}, {"Retry-After": "1"})
+
+            match = re.fullmatch(r"/activities/(\d+)(/streams)?", url.path)
+            if match:
+                activity = fake.activities.get(int(match.group(1)))
+                if activity is None:
+                    return self._send(404, {"message": "Record Not Found"})
+                if match.group(2):
+                    return self._send(200, fake.streams(activity))
+                if method == "PUT":
+                    activity.update({k: v for k, v in body.items() if k in ("name", "description")})
+                    return self._send(200, activity)
+                etag = '"' + hashlib.md5(json.dumps(activity, sort_keys=True).encode()).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, headers={"ETag": etag})
+                return self._send(200, activity, {"ETag": etag})
+            if url.path == "/athlete/activities":
+                return self._send(200, fake.list_activities(query))
+            if url.path == "/athlete":
+                return self._send(200, {"id": 42, "firstname": "Fake"})
+            if re.fullmatch(r"/athletes/\d+/stats", url.path):
+                return self._send(200, fake.athlete_stats())
+            match = re.fullmatch(r"/segments/(\d+)", url.path)
+            if match:
+                return self._send(200, fake.segment(int(match.group(1))))
+            self._send(404, {"message": "Record Not Found"})
+
+        def do_GET(self):
+            self._route("GET")
+
+        def do_PUT(self):
+            self._route("PUT")
+
+        def do_POST(self):
+            self._route("POST")
+
+    return Handler
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    server = FakeStrava(make_history(count))
+    print(f"Fake Strava with {count} activities at {server.start(port=port)} (Ctrl-C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import io
+import os
+import gzip
+import json
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import gpx_writer
+import polyline_batch
+
+# --- CONFIGURATION ---
+# Activities encoded per worker task
+CHUNK_SIZE = 200
+# Decimal places kept in GeoJSON coordinates (5 is the polyline's own precision, ~1 m)
+DEFAULT_PRECISION = 5
+
+def export_format(output_path):
+    name = output_path[:-3] if output_path.endswith(".gz") else output_path
+    if name.endswith(".gpx"):
+        return "gpx"
+    if name.endswith((".ndjson", ".geojsonl", ".jsonl")):
+        return "ndjson"
+    raise ValueError(f"Unknown export format for {output_path} (use .gpx or .ndjson, optionally .gz)")
+
+def _decode_chunk(activities):
+    polylines = [a.get("map", {}).get("summary_polyline", "") for a in activities]
+    lats, lons, offsets = polyline_batch.decode_many(polylines)
+    return polyline_batch.as_floats(lats), polyline_batch.as_floats(lons), offsets
+
+def encode_gpx_chunk(activities):
+    """<trk> elements for a chunk of activities, as one string."""
+    lats, lons, offsets = _decode_chunk(activities)
+    out = io.StringIO()
+    for i, activity in enumerate(activities):
+        start, end = offsets[i], offsets[i + 1]
+        if start == end:
+            continue
+        gpx_writer.write_summary_track(out, activity, lats[start:end], lons[start:end])
+    return out.getvalue()
+
+def encode_ndjson_chunk(activities, precision=DEFAULT_PRECISION):
+    """One GeoJSON LineString feature per line for a chunk of activities."""
+    lats, lons, offsets = _decode_chunk(activities)
+    lines = []
+    for i, activity in enumerate(activities):
+        start, end = offsets[i], offsets[i + 1]
+        if start == end:
+            continue
+        coordinates = [[round(lon, precision), round(lat, precision)] for lat, lon in zip(lats[start:end], lons[start:end])]
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+            "properties": {
+                "id": activity["id"],
+                "name": activity.get("name", ""),
+                "type": activity.get("type"),
+                "start_date": activity["start_date"],
+                "elapsed_time": activity.get("elapsed_time"),
+            },
+        }
+        lines.append(json.dumps(feature, separators=(",", ":"), ensure_ascii=False))
+    return "\n".join(lines) + "\n" if lines else ""
+
+def _chunks(activities, size):
+    chunk = []
+    for activity in activities:
+        if not activity.get("map", {}).get("summary_polyline"):
+            continue
+        chunk.append(activity)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def export_tracks(output_path, activities, workers=None, precision=DEFAULT_PRECISION):
+    """
+    Write many activities into one file: a multi-<trk> GPX or an NDJSON
+    stream of GeoJSON features, gzip'd when the path ends in .gz. Chunks are
+    encoded on a process pool (`workers`, default one per CPU; 1 encodes
+    in-process) and written in order as they complete, then the file is
+    renamed into place. Returns the number of activities exported.
+    """
+    fmt = export_format(output_path)
+    if fmt == "gpx":
+        encode, header, footer = encode_gpx_chunk, gpx_writer.GPX_OPEN, gpx_writer.GPX_CLOSE
+    else:
+        encode, header, footer = partial(encode_ndjson_chunk, precision=precision), "", ""
+    workers = workers or os.cpu_count() or 1
+
+    chunks = list(_chunks(activities, CHUNK_SIZE))
+    count = sum(len(c) for c in chunks)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    opener = gzip.open if output_path.endswith(".gz") else open
+    try:
+        with opener(tmp_path, "wt", encoding="utf-8") as out:
+            out.write(header)
+            if workers == 1 or len(chunks) <= 1:
+                for chunk in chunks:
+                    out.write(encode(chunk))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    for text in pool.map(encode, chunks):
+                        out.write(text)
+            out.write(footer)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    print(f"Exported {count} activities to {output_path}")
+    return count
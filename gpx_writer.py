@@ -0,0 +1,117 @@
+import time
+import datetime
+from array import array
+from xml.sax.saxutils import escape
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python path gives identical output
+    np = None
+
+GPX_OPEN = '<gpx version="1.1" creator="StravaGPXExporter" xmlns="http://www.topografix.com/GPX/1/1">'
+GPX_CLOSE = "</gpx>"
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+def spread_timestamps(start_time, elapsed_time, count):
+    """
+    Yield one "%Y-%m-%dT%H:%M:%SZ" string per point, spreading `elapsed_time`
+    seconds evenly over `count` points. Matches the old per-point
+    `start_time + timedelta(seconds=i * step)` (rounded to the microsecond,
+    then truncated by strftime), but only formats each whole second once.
+    """
+    if count == 0:
+        return
+    step = elapsed_time / count
+    last_second = None
+    last_str = None
+    for i in range(count):
+        second = round(i * step * 1e6) // 1000000
+        if second != last_second:
+            last_second = second
+            last_str = (start_time + datetime.timedelta(seconds=second)).strftime(TIME_FORMAT)
+        yield last_str
+
+def stream_arrays(streams):
+    """
+    Convert a key_by_type streams response into compact arrays:
+    {"lat", "lon", "altitude"} as array('d') and "time" (seconds from start)
+    as array('q'). Returns None without latlng/time streams.
+    """
+    latlng = streams.get("latlng", {}).get("data")
+    offsets = streams.get("time", {}).get("data")
+    if not latlng or not offsets or len(latlng) != len(offsets):
+        return None
+    altitude = streams.get("altitude", {}).get("data")
+    return {
+        "lat": array("d", (p[0] for p in latlng)),
+        "lon": array("d", (p[1] for p in latlng)),
+        "time": array("q", offsets),
+        "altitude": array("d", altitude) if altitude and len(altitude) == len(offsets) else None,
+    }
+
+def stream_timestamps(start_epoch, offsets):
+    """
+    Timestamp strings for `start_epoch` + each offset. With NumPy this is a
+    single vectorized pass; without it, each distinct second is formatted once.
+    """
+    if np is not None:
+        seconds = np.frombuffer(offsets, dtype=np.int64) + np.int64(start_epoch)
+        return np.char.add(np.datetime_as_string(seconds.astype("datetime64[s]"), unit="s"), "Z").tolist()
+    result = []
+    last_offset = last_str = None
+    for offset in offsets:
+        if offset != last_offset:
+            last_offset = offset
+            last_str = time.strftime(TIME_FORMAT, time.gmtime(start_epoch + offset))
+        result.append(last_str)
+    return result
+
+def write_track(out, name, points, elevation=False):
+    """
+    Stream one <trk> element to the writable `out`. `points` is any iterable
+    of (lat, lon, time_str) and is consumed lazily, so memory stays flat
+    however long the track is.
+
+    With `elevation=True` points are (lat, lon, ele, time_str) and each
+    <trkpt> gets an <ele> ahead of its <time>, as the GPX schema orders them.
+    """
+    write = out.write
+    write("<trk>")
+    write(f"<name>{escape(name)}</name>" if name else "<name />")
+
+    points = iter(points)
+    first = next(points, None)
+    if first is None:
+        write("<trkseg /></trk>")
+        return
+
+    write("<trkseg>")
+    if elevation:
+        lat, lon, ele, time_str = first
+        write(f'<trkpt lat="{lat}" lon="{lon}"><ele>{ele}</ele><time>{time_str}</time></trkpt>')
+        for lat, lon, ele, time_str in points:
+            write(f'<trkpt lat="{lat}" lon="{lon}"><ele>{ele}</ele><time>{time_str}</time></trkpt>')
+    else:
+        lat, lon, time_str = first
+        write(f'<trkpt lat="{lat}" lon="{lon}"><time>{time_str}</time></trkpt>')
+        for lat, lon, time_str in points:
+            write(f'<trkpt lat="{lat}" lon="{lon}"><time>{time_str}</time></trkpt>')
+    write("</trkseg></trk>")
+
+def write_gpx(out, name, points, elevation=False):
+    """
+    Stream a single-track GPX document to `out` (see write_track). The
+    output is byte-for-byte what the previous ElementTree builder produced.
+    """
+    out.write(GPX_OPEN)
+    write_track(out, name, points, elevation)
+    out.write(GPX_CLOSE)
+
+def write_summary_track(out, activity, lats, lons):
+    """
+    One <trk> for an activity's decoded summary polyline, with `elapsed_time`
+    spread evenly over the points (what generate_gpx has always done).
+    """
+    start_time = datetime.datetime.strptime(activity["start_date"], TIME_FORMAT)
+    times = spread_timestamps(start_time, activity["elapsed_time"], len(lats))
+    write_track(out, activity.get("name", ""), zip(lats, lons, times))
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# Directory dump() writes <job>.prom and <job>.json into (unset: disabled).
+# Point node_exporter's textfile collector at it.
+METRICS_DIR = os.getenv("METRICS_DIR")
+# Seconds between dumps in the long-running modes (monitor, push receiver, worker)
+METRICS_INTERVAL = int(os.getenv("METRICS_INTERVAL", "60"))
+
+# Seconds; covers a cached lookup up to a rate-limited request
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+# name -> {label tuple: value}
+_counters = {}
+_gauges = {}
+# name -> {label tuple: [bucket counts..., count, sum]}
+_histograms = {}
+_buckets = {}
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+# --- RECORDING ---
+def inc(name, value=1, **labels):
+    with _lock:
+        series = _counters.setdefault(name, {})
+        key = _key(labels)
+        series[key] = series.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges.setdefault(name, {})[_key(labels)] = value
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    with _lock:
+        bounds = _buckets.setdefault(name, buckets)
+        series = _histograms.setdefault(name, {})
+        key = _key(labels)
+        state = series.get(key)
+        if state is None:
+            state = series[key] = [0] * (len(bounds) + 2)
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += 1
+        state[-1] += value
+
+@contextmanager
+def timer(name, **labels):
+    """Observe the wall time of the block in histogram `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+def reset():
+    with _lock:
+        for store in (_counters, _gauges, _histograms, _buckets):
+            store.clear()
+
+# --- EXPORT ---
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+def render_prometheus(job=None):
+    """
+    The registry in the Prometheus text exposition format. `job` is added
+    as a `script` label so several scripts' files can sit side by side.
+    """
+    extra = [("script", job)] if job else []
+    lines = []
+    with _lock:
+        for name in sorted(_counters):
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(_counters[name].items()):
+                lines.append(f"{name}{_format_labels(key, extra)} {value}")
+        for name in sorted(_gauges):
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in sorted(_gauges[name].items()):
+                lines.append(f"{name}{_format_labels(key, extra)} {value}")
+        for name in sorted(_histograms):
+            lines.append(f"# TYPE {name} histogram")
+            bounds = _buckets[name]
+            for key, state in sorted(_histograms[name].items()):
+                for bound, count in zip(list(bounds) + [float("inf")], state[:len(bounds)] + [state[-2]]):
+                    lines.append(f"{name}_bucket{_format_labels(key, extra + [('le', _format_bound(bound))])} {count}")
+                lines.append(f"{name}_sum{_format_labels(key, extra)} {state[-1]}")
+                lines.append(f"{name}_count{_format_labels(key, extra)} {state[-2]}")
+    return "\n".join(lines) + "\n"
+
+def snapshot():
+    """The registry as plain dicts (histograms as count/sum/buckets)."""
+    def series(store, convert):
+        return {name: [{"labels": dict(key), **convert(value)} for key, value in sorted(values.items())]
+                for name, values in sorted(store.items())}
+
+    with _lock:
+        return {
+            "generated_at": time.time(),
+            "counters": series(_counters, lambda v: {"value": v}),
+            "gauges": series(_gauges, lambda v: {"value": v}),
+            "histograms": {
+                name: [{
+                    "labels": dict(key),
+                    "count": state[-2],
+                    "sum": state[-1],
+                    "buckets": dict(zip(map(_format_bound, _buckets[name]), state[:len(_buckets[name])])),
+                } for key, state in sorted(values.items())]
+                for name, values in sorted(_histograms.items())
+            },
+        }
+
+def _write_atomic(path, text):
+    # The collector may read at any moment; never expose a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def dump(job, directory=None):
+    """Write <job>.prom and <job>.json into `directory` (default METRICS_DIR)."""
+    directory = directory or METRICS_DIR
+    if not directory:
+        return
+    set_gauge("strava_metrics_last_dump_timestamp_seconds", time.time())
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _write_atomic(os.path.join(directory, f"{job}.prom"), render_prometheus(job))
+        _write_atomic(os.path.join(directory, f"{job}.json"), json.dumps(snapshot(), indent=2))
+    except OSError as e:
+        print(f"Could not write metrics: {e}")
+
+def dump_every(job, interval, stop_event):
+    """Dump every `interval` seconds on a daemon thread until `stop_event` is set (long-running modes)."""
+    def run():
+        while not stop_event.wait(interval):
+            dump(job)
+
+    if METRICS_DIR and interval > 0:
+        threading.Thread(target=run, name="metrics-dump", daemon=True).start()
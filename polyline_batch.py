@@ -0,0 +1,93 @@
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python path gives identical output
+    np = None
+
+def decode_many(encoded, precision=5):
+    """
+    Decode many encoded polylines at once into flat coordinate arrays.
+
+    Returns (lats, lons, offsets): the points of polyline i are
+    lats[offsets[i]:offsets[i + 1]] / lons[...]. With NumPy the arrays are
+    float64/int64 ndarrays and the whole batch is decoded in a handful of
+    vectorized passes; otherwise they are array('d') / array('q'). Values
+    are exactly those of polyline.decode, without building tuples.
+    """
+    encoded = list(encoded)
+    if np is not None:
+        return _decode_numpy(encoded, precision)
+    return _decode_python(encoded, precision)
+
+def as_floats(values):
+    """Plain Python floats for formatting (ndarray -> list, array('d') as is)."""
+    return values.tolist() if np is not None and isinstance(values, np.ndarray) else values
+
+def _decode_numpy(encoded, precision):
+    factor = float(10 ** precision)
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    byte_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=byte_offsets[1:])
+    if byte_offsets[-1] == 0:
+        empty = np.zeros(0, dtype=np.float64)
+        return empty, empty.copy(), np.zeros(len(encoded) + 1, dtype=np.int64)
+
+    chunks = np.frombuffer("".join(encoded).encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    # A chunk below 0x20 ends a value; every value's bits are spread over
+    # 5-bit groups, least significant first
+    is_end = chunks < 0x20
+    ends = np.flatnonzero(is_end)
+    if not is_end[byte_offsets[1:][lengths > 0] - 1].all():
+        raise ValueError("truncated polyline")
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    value_index = np.cumsum(is_end) - is_end
+    shift = 5 * (np.arange(len(chunks), dtype=np.int64) - starts[value_index])
+    values = np.add.reduceat((chunks & 0x1F) << shift, starts)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    # Values per polyline come in (lat, lon) pairs
+    value_offsets = np.searchsorted(ends, byte_offsets)
+    if ((value_offsets[1:] - value_offsets[:-1]) % 2).any():
+        raise ValueError("polyline with an odd number of values")
+    offsets = value_offsets // 2
+
+    lat_sum = np.cumsum(deltas[0::2])
+    lon_sum = np.cumsum(deltas[1::2])
+    # Restart the running sums at every polyline boundary
+    counts = offsets[1:] - offsets[:-1]
+    first = offsets[:-1][counts > 0]
+    lat_base = np.where(first > 0, lat_sum[first - 1], 0)
+    lon_base = np.where(first > 0, lon_sum[first - 1], 0)
+    lat_sum -= np.repeat(lat_base, counts[counts > 0])
+    lon_sum -= np.repeat(lon_base, counts[counts > 0])
+    return lat_sum / factor, lon_sum / factor, offsets
+
+def _decode_python(encoded, precision):
+    factor = float(10 ** precision)
+    lats = array("d")
+    lons = array("d")
+    offsets = array("q", [0])
+    for expression in encoded:
+        index, lat, lng, length = 0, 0, 0, len(expression)
+        while index < length:
+            for axis in (0, 1):
+                result = shift = 0
+                while True:
+                    byte = ord(expression[index]) - 63
+                    index += 1
+                    result |= (byte & 0x1F) << shift
+                    shift += 5
+                    if byte < 0x20:
+                        break
+                delta = ~(result >> 1) if result & 1 else result >> 1
+                if axis == 0:
+                    lat += delta
+                else:
+                    lng += delta
+            lats.append(lat / factor)
+            lons.append(lng / factor)
+        offsets.append(len(lats))
+    return lats, lons, offsets
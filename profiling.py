@@ -0,0 +1,139 @@
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import datetime
+import threading
+import tracemalloc
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# Rows per report section, and stack depth kept per allocation
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "40"))
+PROFILE_FRAMES = int(os.getenv("PROFILE_FRAMES", "5"))
+# How often memory is sampled for the peak allocation snapshot (seconds)
+PROFILE_SAMPLE_INTERVAL = 0.2
+
+# Allocations made by the profiler itself and the import machinery
+IGNORED_ALLOCATIONS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+# --- PEAK SAMPLER ---
+class PeakSampler:
+    """
+    tracemalloc only reports what is still allocated when asked, and most of
+    a run's memory is freed again by the end. This keeps a snapshot from the
+    moment traced memory was highest (within the sampling interval).
+    """
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.snapshot = None
+        self.size = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def sample(self):
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.size * 1.1:
+            self.size = current
+            self.snapshot = tracemalloc.take_snapshot()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+# --- PROFILING ---
+def profile_call(name, func, *args, directory=None):
+    """
+    Run func(*args) under cProfile and tracemalloc and write
+    <name>-profile-<timestamp>.txt (report) and .pstats (for snakeviz or
+    pstats) into `directory` (default: the working directory). Worker
+    threads started during the run are profiled too. Returns func's result.
+    """
+    thread_profilers = []
+
+    def profile_thread(frame, event, arg):
+        # Runs once as each new thread starts; swap in a profiler of its own
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return
+        thread_profilers.append(profiler)
+
+    tracemalloc.start(PROFILE_FRAMES)
+    sampler = PeakSampler()
+    sampler.start()
+    threading.setprofile(profile_thread)
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        elapsed = time.perf_counter() - start
+        threading.setprofile(None)
+        sampler.stop()
+        end_snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = pstats.Stats(profiler)
+        for thread_profiler in thread_profilers:
+            thread_profiler.disable()
+            stats.add(thread_profiler)
+        write_report(name, stats, sampler.snapshot, end_snapshot, elapsed, peak, len(thread_profilers), directory)
+
+def format_stats(stats, sort_key):
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats(sort_key).print_stats(PROFILE_TOP)
+    # Drop pstats' own header; the report has one
+    text = out.getvalue()
+    return text[text.find("   ncalls"):] if "   ncalls" in text else text
+
+def format_allocations(snapshot):
+    if snapshot is None:
+        return "  (no samples)\n"
+    lines = []
+    for stat in snapshot.filter_traces(IGNORED_ALLOCATIONS).statistics("traceback")[:PROFILE_TOP]:
+        lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks")
+        for frame_line in stat.traceback.format(most_recent_first=True):
+            lines.append(f"    {frame_line}")
+    return "\n".join(lines) + "\n"
+
+def write_report(name, stats, peak_snapshot, end_snapshot, elapsed, peak, threads, directory=None):
+    directory = directory or os.getcwd()
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    base = os.path.join(directory, f"{name}-profile-{stamp}")
+    stats.dump_stats(f"{base}.pstats")
+
+    with open(f"{base}.txt", "w") as f:
+        f.write(f"Profile of {name}: {' '.join(sys.argv)}\n")
+        f.write(f"Wall time {elapsed:.3f}s, peak traced memory {peak / 1024 / 1024:.1f} MiB, "
+                f"{threads} worker threads profiled\n\n")
+        f.write(f"=== Hot functions by own time (top {PROFILE_TOP}) ===\n")
+        f.write(format_stats(stats, "tottime"))
+        f.write(f"\n=== Hot functions by cumulative time (top {PROFILE_TOP}) ===\n")
+        f.write(format_stats(stats, "cumulative"))
+        f.write(f"\n=== Allocation sites at peak memory (top {PROFILE_TOP}) ===\n")
+        f.write(format_allocations(peak_snapshot))
+        f.write(f"\n=== Allocations still live at exit (top {PROFILE_TOP}) ===\n")
+        f.write(format_allocations(end_snapshot))
+    print(f"Profile written to {base}.txt")
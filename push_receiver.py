@@ -0,0 +1,160 @@
+import os
+import json
+import queue
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+
+import strava_client
+import response_cache
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+PUSH_HOST = os.getenv("PUSH_HOST", "0.0.0.0")
+PUSH_PORT = int(os.getenv("PUSH_PORT", "8080"))
+# Shared secret echoed back by Strava when the subscription is created
+PUSH_VERIFY_TOKEN = os.getenv("STRAVA_VERIFY_TOKEN")
+PUSH_SUBSCRIPTIONS_URL = f"{strava_client.API_BASE}/push_subscriptions"
+
+HANDLED_ASPECTS = ("create", "update")
+
+# --- WORK QUEUE ---
+class ActivityQueue:
+    """
+    FIFO of activity IDs for a single consumer. An ID that is already
+    waiting is not queued twice (Strava often sends create + update
+    back to back); `refresh` is kept if any of the merged events set it.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def put(self, activity_id, refresh=False):
+        with self._lock:
+            if activity_id in self._pending:
+                self._pending[activity_id] |= refresh
+                return False
+            self._pending[activity_id] = refresh
+        self._queue.put(activity_id)
+        return True
+
+    def get(self, timeout=None):
+        """Next (activity_id, refresh), or (None, False) once stopped."""
+        activity_id = self._queue.get(timeout=timeout)
+        with self._lock:
+            refresh = self._pending.pop(activity_id, False)
+        return activity_id, refresh
+
+    def stop(self):
+        self._queue.put(None)
+
+def run_worker(work_queue, handler):
+    """Feed queued IDs to `handler` one at a time (streak renames are ordered)."""
+    while True:
+        activity_id, refresh = work_queue.get()
+        if activity_id is None:
+            return
+        try:
+            if refresh:
+                # The cached details predate the update; fetch them afresh
+                response_cache.invalidate(f"{strava_client.API_BASE}/activities/{activity_id}")
+            handler(activity_id)
+        except Exception as e:
+            print(f"Processing pushed activity {activity_id} failed: {e}")
+
+# --- HTTP ---
+def make_handler(work_queue, verify_token):
+    class PushHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, body=None):
+            data = json.dumps(body or {}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            # Subscription validation: echo hub.challenge if the token matches
+            params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            if params.get("hub.mode") != "subscribe" or "hub.challenge" not in params:
+                return self._reply(404)
+            if not verify_token or params.get("hub.verify_token") != verify_token:
+                print("Rejected push subscription validation (bad verify token)")
+                return self._reply(403)
+            print("Push subscription validated")
+            self._reply(200, {"hub.challenge": params["hub.challenge"]})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                event = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._reply(400)
+            # Strava expects a 200 within two seconds; processing happens off-thread
+            self._reply(200)
+            handle_event(event, work_queue)
+
+    return PushHandler
+
+def handle_event(event, work_queue):
+    object_type = event.get("object_type")
+    aspect_type = event.get("aspect_type")
+    object_id = event.get("object_id")
+    if object_type != "activity" or aspect_type not in HANDLED_ASPECTS or not object_id:
+        print(f"Ignoring push event: {object_type} {aspect_type} {object_id}")
+        return
+    if work_queue.put(str(object_id), refresh=aspect_type == "update"):
+        print(f"Queued activity {object_id} ({aspect_type})")
+
+def make_server(handler, host=PUSH_HOST, port=PUSH_PORT, verify_token=PUSH_VERIFY_TOKEN):
+    """
+    Build the receiver without starting it: returns (server, work_queue,
+    worker thread). Port 0 picks a free port (server.server_port).
+    """
+    work_queue = ActivityQueue()
+    server = ThreadingHTTPServer((host, port), make_handler(work_queue, verify_token))
+    worker = threading.Thread(target=run_worker, args=(work_queue, handler), name="push-worker", daemon=True)
+    return server, work_queue, worker
+
+def serve(handler, host=PUSH_HOST, port=PUSH_PORT):
+    """Receive push events until SIGINT/SIGTERM, processing each activity with `handler`."""
+    server, work_queue, worker = make_server(handler, host, port)
+    worker.start()
+
+    def shutdown(signum, frame):
+        # shutdown() waits for serve_forever, so it cannot run on this thread
+        threading.Thread(target=server.shutdown).start()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, shutdown)
+
+    print(f"Listening for Strava push events on {host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        work_queue.stop()
+        worker.join()
+        print("Push receiver stopped.")
+
+# --- SUBSCRIPTION ---
+def create_subscription(callback_url):
+    """Register `callback_url` with Strava; it must be reachable for validation."""
+    response = strava_client.get_session().post(PUSH_SUBSCRIPTIONS_URL, data={
+        "client_id": strava_client.CLIENT_ID,
+        "client_secret": strava_client.CLIENT_SECRET,
+        "callback_url": callback_url,
+        "verify_token": PUSH_VERIFY_TOKEN,
+    }, timeout=strava_client.DEFAULT_TIMEOUT)
+    if response.status_code in (200, 201):
+        print(f"Push subscription created: {response.json().get('id')}")
+        return response.json()
+    print(f"Error creating push subscription: {response.status_code}, {response.text}")
+    return None
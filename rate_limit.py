@@ -0,0 +1,138 @@
+import time
+import heapq
+import itertools
+import threading
+
+# Strava counts requests in fixed 15-minute windows (aligned to :00, :15,
+# :30, :45) and per UTC day.
+SHORT_WINDOW = 15 * 60
+DAY = 24 * 60 * 60
+
+# Lower number goes first when several requests wait for budget
+PRIORITY_HIGH = 0     # renames / activity updates
+PRIORITY_NORMAL = 1   # activity lists and details
+PRIORITY_LOW = 2      # GPX streams, segment polling
+
+def _parse_pair(value):
+    try:
+        short, long = value.split(",")
+        return int(short), int(long)
+    except (AttributeError, ValueError):
+        return None
+
+class RateLimiter:
+    """
+    Token bucket fed by Strava's X-RateLimit-* headers. The bucket refills so
+    that the remaining 15-minute budget is spread over the rest of the window,
+    with up to `burst` requests allowed back to back. Waiters are served in
+    priority order.
+    """
+
+    def __init__(self, short_limit=100, long_limit=1000, burst=10, max_wait=SHORT_WINDOW, clock=time.time):
+        self.short_limit = short_limit
+        self.long_limit = long_limit
+        self.short_usage = 0
+        self.long_usage = 0
+        self.burst = burst
+        self.max_wait = max_wait
+        self.clock = clock
+
+        now = clock()
+        self.tokens = float(burst)
+        self.last_refill = now
+        self.short_window = int(now // SHORT_WINDOW)
+        self.day = int(now // DAY)
+        self.blocked_until = 0.0
+
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+
+    # --- window bookkeeping (call with the lock held) ---
+    def _roll_windows(self, now):
+        window = int(now // SHORT_WINDOW)
+        if window != self.short_window:
+            self.short_window = window
+            self.short_usage = 0
+        day = int(now // DAY)
+        if day != self.day:
+            self.day = day
+            self.long_usage = 0
+
+    def _refill_rate(self, now):
+        remaining = max(0, self.short_limit - self.short_usage)
+        seconds_left = SHORT_WINDOW - (now % SHORT_WINDOW)
+        return remaining / seconds_left
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.last_refill)
+        self.tokens = min(self.burst, self.tokens + elapsed * self._refill_rate(now))
+        self.last_refill = now
+
+    def _delay(self, now):
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.short_usage >= self.short_limit:
+            return SHORT_WINDOW - (now % SHORT_WINDOW)
+        if self.long_usage >= self.long_limit:
+            return DAY - (now % DAY)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self._refill_rate(now)
+
+    # --- public API ---
+    def acquire(self, priority=PRIORITY_NORMAL):
+        """Block until a request of this priority may be sent."""
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = self.clock()
+                    self._roll_windows(now)
+                    self._refill(now)
+                    timeout = None
+                    if self._waiting[0] == entry:
+                        delay = self._delay(now)
+                        # A budget that won't come back within max_wait (the
+                        # daily cap) is left to the server to reject
+                        if delay <= 0 or delay > self.max_wait:
+                            self.tokens = max(0.0, self.tokens - 1)
+                            self.short_usage += 1
+                            self.long_usage += 1
+                            return
+                        timeout = delay
+                    self._cond.wait(timeout)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def update(self, headers):
+        """Take limits and usage from a response's headers (the server's count wins)."""
+        pairs = []
+        for prefix in ("X-RateLimit", "X-ReadRateLimit"):
+            limit = _parse_pair(headers.get(f"{prefix}-Limit"))
+            usage = _parse_pair(headers.get(f"{prefix}-Usage"))
+            if limit and usage:
+                pairs.append((limit, usage))
+        if not pairs:
+            return
+        with self._cond:
+            self._roll_windows(self.clock())
+            # Track whichever budget (overall or read) is tighter
+            (self.short_limit, _), (self.short_usage, _) = min(pairs, key=lambda p: p[0][0] - p[1][0])
+            (_, self.long_limit), (_, self.long_usage) = min(pairs, key=lambda p: p[0][1] - p[1][1])
+            self._cond.notify_all()
+
+    def retry_after(self, headers):
+        """Seconds to back off after a 429 (Retry-After, else the window reset)."""
+        try:
+            return max(1.0, float(headers.get("Retry-After")))
+        except (TypeError, ValueError):
+            return SHORT_WINDOW - (self.clock() % SHORT_WINDOW)
+
+    def block_for(self, seconds):
+        with self._cond:
+            self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+            self._cond.notify_all()
@@ -0,0 +1,92 @@
+import os
+import time
+import sqlite3
+import threading
+from urllib.parse import urlencode
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+DB_PATH = os.getenv("HTTP_CACHE_PATH", "http_cache.db")
+MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+_conn = None
+# Batch mode reads the cache from worker threads; one connection, one lock
+_lock = threading.Lock()
+
+# --- DATABASE ---
+def _get_connection():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                etag TEXT,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_url ON responses (url)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        _conn.commit()
+    return _conn
+
+def make_key(url, params=None):
+    if not params:
+        return url
+    return f"{url}?{urlencode(sorted(dict(params).items()))}"
+
+# --- CACHE OPERATIONS ---
+def lookup(key):
+    """Return {"etag", "body", "fetched_at"} for a cached response, or None."""
+    with _lock:
+        conn = _get_connection()
+        row = conn.execute(
+            "SELECT etag, body, fetched_at FROM responses WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?", (time.time(), key))
+        conn.commit()
+    return {"etag": row[0], "body": row[1], "fetched_at": row[2]}
+
+def store(key, url, etag, body):
+    now = time.time()
+    with _lock:
+        conn = _get_connection()
+        with conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO responses (cache_key, url, etag, body, size, fetched_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (key, url, etag, body, len(body), now, now))
+            _evict(conn)
+
+def mark_fresh(key):
+    """The server confirmed the cached body (304); restart its TTL."""
+    with _lock:
+        conn = _get_connection()
+        with conn:
+            conn.execute("UPDATE responses SET fetched_at = ? WHERE cache_key = ?", (time.time(), key))
+
+def invalidate(url):
+    """Drop every cached response for `url`, whatever its query string."""
+    with _lock:
+        conn = _get_connection()
+        with conn:
+            conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+
+def _evict(conn):
+    # Least recently used entries go first once the cache outgrows MAX_BYTES
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= MAX_BYTES:
+        return
+    for key, size in conn.execute("SELECT cache_key, size FROM responses ORDER BY last_access ASC").fetchall():
+        conn.execute("DELETE FROM responses WHERE cache_key = ?", (key,))
+        total -= size
+        if total <= MAX_BYTES:
+            break
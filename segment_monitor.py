@@ -0,0 +1,395 @@
+import os
+import time
+import json
+import random
+import signal
+import datetime
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+import strava_client
+import metrics
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+SEGMENT_DB_PATH = os.getenv("SEGMENT_DB_PATH", "segment_history.db")
+# Comma-separated segment IDs watched by the monitor
+SEGMENT_IDS = [int(s) for s in os.getenv("SEGMENT_IDS", "").split(",") if s.strip()]
+SEGMENT_POLL_INTERVAL = int(os.getenv("SEGMENT_POLL_INTERVAL", "60"))
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", "8"))
+
+# Alert when a segment gained more than this many efforts since the last poll
+EFFORT_ALERT_THRESHOLD = 2
+
+# Raw polls older than this are pruned (the latest per segment is always
+# kept); hourly rollups are kept longer and daily rollups forever. 0 keeps all.
+SEGMENT_RAW_RETENTION_DAYS = int(os.getenv("SEGMENT_RAW_RETENTION_DAYS", "30"))
+SEGMENT_HOURLY_RETENTION_DAYS = int(os.getenv("SEGMENT_HOURLY_RETENTION_DAYS", "400"))
+
+# Alert delivery: retries back off exponentially (with jitter) up to the cap
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_BASE_BACKOFF = 30
+WEBHOOK_MAX_BACKOFF = 3600
+WEBHOOK_BATCH_LIMIT = 50
+
+SCHEMA_VERSION = 2
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Rollup table -> strftime pattern of its bucket (UTC, like CURRENT_TIMESTAMP)
+ROLLUPS = {
+    "segment_rollup_hourly": "%Y-%m-%d %H:00:00",
+    "segment_rollup_daily": "%Y-%m-%d",
+}
+
+# --- DATABASE ---
+def init_segment_db(path=SEGMENT_DB_PATH):
+    conn = sqlite3.connect(path)
+    # WAL lets readers (dashboards, ad-hoc queries) run while the monitor writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS segment_efforts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            segment_id INTEGER NOT NULL,
+            effort_count INTEGER NOT NULL,
+            athlete_count INTEGER,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    migrate_segment_db(conn)
+    return conn
+
+def migrate_segment_db(conn):
+    """Bring an existing segment_history.db up to SCHEMA_VERSION."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    with conn:
+        if version < 1:
+            # Keeps the per-poll "last value" lookup an index seek
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_segment_efforts_segment_ts ON segment_efforts (segment_id, timestamp)")
+            # Deltas are the sum of poll-to-poll differences landing in the bucket
+            for table in ROLLUPS:
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        segment_id INTEGER NOT NULL,
+                        bucket TEXT NOT NULL,
+                        min_effort_count INTEGER NOT NULL,
+                        max_effort_count INTEGER NOT NULL,
+                        effort_delta INTEGER NOT NULL DEFAULT 0,
+                        athlete_delta INTEGER NOT NULL DEFAULT 0,
+                        samples INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (segment_id, bucket)
+                    )
+                """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS segment_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            _backfill_rollups(conn)
+        if version < 2:
+            # Webhook payloads waiting for (re)delivery, oldest first
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS webhook_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_webhook_outbox_due ON webhook_outbox (next_attempt_at)")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def _backfill_rollups(conn):
+    # One pass over the raw history collected before the rollups existed
+    for table, pattern in ROLLUPS.items():
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"""
+            INSERT INTO {table} (segment_id, bucket, min_effort_count, max_effort_count, effort_delta, athlete_delta, samples)
+            SELECT segment_id, strftime('{pattern}', timestamp), MIN(effort_count), MAX(effort_count),
+                   COALESCE(SUM(effort_diff), 0), COALESCE(SUM(athlete_diff), 0), COUNT(*)
+            FROM (
+                SELECT segment_id, timestamp, effort_count,
+                       effort_count - LAG(effort_count) OVER w AS effort_diff,
+                       athlete_count - LAG(athlete_count) OVER w AS athlete_diff
+                FROM segment_efforts
+                WINDOW w AS (PARTITION BY segment_id ORDER BY timestamp, id)
+            )
+            GROUP BY 1, 2
+        """)
+
+def _update_rollups(conn, segment_id, timestamp, effort_count, effort_diff, athlete_diff):
+    when = datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    for table, pattern in ROLLUPS.items():
+        conn.execute(f"""
+            INSERT INTO {table} (segment_id, bucket, min_effort_count, max_effort_count, effort_delta, athlete_delta, samples)
+            VALUES (?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(segment_id, bucket) DO UPDATE SET
+                min_effort_count = MIN(min_effort_count, excluded.min_effort_count),
+                max_effort_count = MAX(max_effort_count, excluded.max_effort_count),
+                effort_delta = effort_delta + excluded.effort_delta,
+                athlete_delta = athlete_delta + excluded.athlete_delta,
+                samples = samples + 1
+        """, (segment_id, when.strftime(pattern), effort_count, effort_count, effort_diff, athlete_diff))
+
+def prune_segment_history(conn, timestamp):
+    """
+    Apply the retention windows, at most once per hour (tracked in
+    segment_meta so one-shot cron runs share the schedule).
+    """
+    hour = timestamp[:13]
+    row = conn.execute("SELECT value FROM segment_meta WHERE key = 'last_prune_hour'").fetchone()
+    if row and row[0] == hour:
+        return
+    now = datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    if SEGMENT_RAW_RETENTION_DAYS > 0:
+        cutoff = (now - datetime.timedelta(days=SEGMENT_RAW_RETENTION_DAYS)).strftime(TIMESTAMP_FORMAT)
+        # The latest poll of each segment is the baseline for the next diff
+        conn.execute("""
+            DELETE FROM segment_efforts
+            WHERE timestamp < ?
+              AND id NOT IN (SELECT MAX(id) FROM segment_efforts GROUP BY segment_id)
+        """, (cutoff,))
+    if SEGMENT_HOURLY_RETENTION_DAYS > 0:
+        cutoff = (now - datetime.timedelta(days=SEGMENT_HOURLY_RETENTION_DAYS)).strftime(TIMESTAMP_FORMAT)
+        conn.execute("DELETE FROM segment_rollup_hourly WHERE bucket < ?", (cutoff,))
+    conn.execute(
+        "INSERT INTO segment_meta (key, value) VALUES ('last_prune_hour', ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (hour,)
+    )
+
+# --- API ---
+def get_segment_data(segment_id):
+    response = strava_client.get(f"/segments/{segment_id}", priority=strava_client.PRIORITY_LOW)
+    if response.status_code != 200:
+        print(f"Error fetching segment {segment_id}: {response.status_code}, {response.text}")
+        return None
+    return response.json()
+
+def fetch_segments(segment_ids, workers=SEGMENT_WORKERS):
+    """
+    Fetch several segments concurrently; returns {segment_id: data or None}.
+    A network error or unparsable response only fails that segment's poll.
+    """
+    import requests
+
+    def fetch(segment_id):
+        try:
+            return get_segment_data(segment_id)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error fetching segment {segment_id}: {e}")
+            return None
+
+    if len(segment_ids) == 1:
+        return {segment_ids[0]: fetch(segment_ids[0])}
+    with ThreadPoolExecutor(max_workers=min(workers, len(segment_ids))) as pool:
+        return dict(zip(segment_ids, pool.map(fetch, segment_ids)))
+
+# --- RECORDING ---
+def record_round(conn, segments):
+    """
+    Store one polling round ({segment_id: data}), its rollup updates and
+    any alert in a single transaction, so an alert is queued exactly when
+    its poll is recorded. Returns the (segment_id, diff) pairs that crossed
+    the alert threshold.
+    """
+    alerts = []
+    # One timestamp per round, in CURRENT_TIMESTAMP's format
+    timestamp = datetime.datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    with conn:
+        for segment_id, data in segments.items():
+            if not data:
+                metrics.inc("strava_segment_polls_total", result="failed")
+                continue
+            metrics.inc("strava_segment_polls_total", result="ok")
+            effort_count = data.get("effort_count")
+            athlete_count = data.get("athlete_count")
+
+            last_effort = conn.execute(
+                "SELECT effort_count, athlete_count FROM segment_efforts WHERE segment_id = ? ORDER BY timestamp DESC, id DESC LIMIT 1",
+                (segment_id,)
+            ).fetchone()
+
+            diff = None
+            athlete_diff = 0
+            if last_effort:
+                diff = effort_count - last_effort[0]
+                if athlete_count is not None and last_effort[1] is not None:
+                    athlete_diff = athlete_count - last_effort[1]
+                print(f"Effort difference: {diff}")
+
+            conn.execute(
+                "INSERT INTO segment_efforts (segment_id, effort_count, athlete_count, timestamp) VALUES (?, ?, ?, ?)",
+                (segment_id, effort_count, athlete_count, timestamp)
+            )
+            _update_rollups(conn, segment_id, timestamp, effort_count, diff or 0, athlete_diff)
+            print(f"Recorded segment {segment_id}: {effort_count} efforts, {athlete_count} athletes")
+
+            if diff is not None and diff > EFFORT_ALERT_THRESHOLD:
+                alerts.append((segment_id, diff))
+        if alerts:
+            metrics.inc("strava_segment_alerts_total", len(alerts))
+            enqueue_alerts(conn, alerts)
+        prune_segment_history(conn, timestamp)
+    return alerts
+
+# --- WEBHOOK OUTBOX ---
+def alerts_payload(alerts):
+    """
+    One payload for a round's alerts. A single alert also keeps the
+    original top-level effort_diff/segment_id keys.
+    """
+    payload = {"alerts": [{"segment_id": segment_id, "effort_diff": diff} for segment_id, diff in alerts]}
+    if len(alerts) == 1:
+        payload["effort_diff"] = alerts[0][1]
+        payload["segment_id"] = alerts[0][0]
+    return payload
+
+def enqueue_alerts(conn, alerts):
+    if not WEBHOOK_URL:
+        return
+    conn.execute(
+        "INSERT INTO webhook_outbox (payload, next_attempt_at) VALUES (?, ?)",
+        (json.dumps(alerts_payload(alerts)), time.time())
+    )
+
+def backoff_delay(attempts):
+    """Seconds before retry number `attempts`: exponential, capped, half-jittered."""
+    delay = min(WEBHOOK_MAX_BACKOFF, WEBHOOK_BASE_BACKOFF * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+def send_to_webhook(payload):
+    """POST one payload; returns None on success, else an error string."""
+    try:
+        response = strava_client.get_session().post(
+            WEBHOOK_URL, json=payload, headers={"Content-Type": "application/json"},
+            timeout=strava_client.DEFAULT_TIMEOUT
+        )
+    except Exception as e:
+        return f"request failed: {e}"
+    if response.status_code in (200, 201, 202):
+        return None
+    return f"{response.status_code}, {response.text}"
+
+def deliver_outbox(conn, limit=WEBHOOK_BATCH_LIMIT):
+    """
+    Deliver due outbox entries in order. Delivered entries are deleted; a
+    failure reschedules the entry with backoff. Returns the number sent.
+    """
+    if not WEBHOOK_URL:
+        return 0
+    due = conn.execute(
+        "SELECT id, payload, attempts FROM webhook_outbox WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+        (time.time(), limit)
+    ).fetchall()
+    sent = 0
+    for entry_id, payload, attempts in due:
+        error = send_to_webhook(json.loads(payload))
+        with conn:
+            if error is None:
+                conn.execute("DELETE FROM webhook_outbox WHERE id = ?", (entry_id,))
+            else:
+                attempts += 1
+                conn.execute(
+                    "UPDATE webhook_outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (attempts, time.time() + backoff_delay(attempts), error, entry_id)
+                )
+        if error is None:
+            sent += 1
+            metrics.inc("strava_webhook_deliveries_total", result="sent")
+            print(f"Sent {payload} to webhook")
+        else:
+            metrics.inc("strava_webhook_deliveries_total", result="failed")
+            print(f"Webhook error (attempt {attempts}): {error}")
+    if due:
+        pending = conn.execute("SELECT COUNT(*) FROM webhook_outbox").fetchone()[0]
+        metrics.set_gauge("strava_webhook_outbox_pending", pending)
+    return sent
+
+def next_delivery_in(conn):
+    """Seconds until the earliest pending entry is due, or None if the outbox is empty."""
+    row = conn.execute("SELECT MIN(next_attempt_at) FROM webhook_outbox").fetchone()
+    return None if row[0] is None else max(0.0, row[0] - time.time())
+
+def delivery_worker(stop_event, wake_event, path=SEGMENT_DB_PATH):
+    """
+    Background delivery loop for the monitor: sleeps until the next entry is
+    due or `wake_event` signals a new one. Uses its own connection.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        while not stop_event.is_set():
+            wake_event.clear()
+            deliver_outbox(conn)
+            wait = next_delivery_in(conn)
+            wake_event.wait(WEBHOOK_MAX_BACKOFF if wait is None else wait)
+    finally:
+        conn.close()
+
+def record_segment_efforts(segment_id):
+    """Poll a single segment once (the cron `--segment` path)."""
+    data = get_segment_data(segment_id)
+    if not data:
+        return
+
+    conn = init_segment_db()
+    try:
+        record_round(conn, {segment_id: data})
+        # No background worker here; also retries anything left from earlier runs
+        deliver_outbox(conn)
+    finally:
+        conn.close()
+
+# --- MONITOR DAEMON ---
+def poll_round(conn, segment_ids, workers=SEGMENT_WORKERS):
+    """Fetch and record one round; returns the alerts it queued."""
+    with metrics.timer("strava_segment_round_seconds"):
+        return record_round(conn, fetch_segments(segment_ids, workers))
+
+def monitor(segment_ids, interval=SEGMENT_POLL_INTERVAL, workers=SEGMENT_WORKERS, stop_event=None):
+    """
+    Poll `segment_ids` every `interval` seconds until stopped (SIGINT/SIGTERM
+    or `stop_event`). Segments are fetched concurrently over the shared HTTP
+    pool and each round is written in one transaction on a single
+    long-lived connection. Alerts are queued in the outbox and delivered
+    by a background thread, so a slow webhook never delays polling.
+    """
+    segment_ids = list(dict.fromkeys(segment_ids))
+    stop_event = stop_event or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda signum, frame: stop_event.set())
+
+    print(f"Monitoring {len(segment_ids)} segments every {interval}s")
+    conn = init_segment_db()
+    wake_event = threading.Event()
+    # The worker's own waits end on wake_event, so stopping sets both
+    worker_stop = threading.Event()
+    worker = threading.Thread(target=delivery_worker, args=(worker_stop, wake_event), name="webhook-delivery", daemon=True)
+    worker.start()
+    try:
+        next_round = time.monotonic()
+        while not stop_event.is_set():
+            if poll_round(conn, segment_ids, workers):
+                wake_event.set()
+
+            next_round += interval
+            # A round that overran the interval starts the next one right away,
+            # without trying to make up the missed rounds
+            now = time.monotonic()
+            if next_round < now:
+                next_round = now
+            stop_event.wait(next_round - now)
+    finally:
+        worker_stop.set()
+        wake_event.set()
+        worker.join(timeout=10)
+        conn.close()
+        print("Segment monitor stopped.")
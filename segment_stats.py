@@ -0,0 +1,130 @@
+import io
+import os
+import csv
+import json
+import datetime
+import pytz
+from dotenv import load_dotenv
+
+import segment_monitor
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# Hour-of-day and weekday stats are reported in this zone; rollups are UTC
+STATS_TIMEZONE = os.getenv("SEGMENT_STATS_TIMEZONE", "Europe/Vienna")
+BUSIEST_LIMIT = 10
+WEEKS = 12
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+STATS_KINDS = ("hour", "weekday", "busiest", "week")
+
+# --- QUERIES ---
+def _local_hours(conn, segment_id, tz):
+    """(local datetime, efforts, athletes) per hourly rollup bucket."""
+    rows = conn.execute(
+        "SELECT bucket, effort_delta, athlete_delta FROM segment_rollup_hourly WHERE segment_id = ?",
+        (segment_id,)
+    )
+    for bucket, efforts, athletes in rows:
+        utc = datetime.datetime.strptime(bucket, segment_monitor.TIMESTAMP_FORMAT).replace(tzinfo=pytz.utc)
+        yield utc.astimezone(tz), efforts, athletes
+
+def efforts_by_hour(conn, segment_id, tz):
+    """Total and average new efforts per local hour of day."""
+    totals = {hour: [0, 0, 0] for hour in range(24)}
+    for local, efforts, athletes in _local_hours(conn, segment_id, tz):
+        total = totals[local.hour]
+        total[0] += efforts
+        total[1] += athletes
+        total[2] += 1
+    return [
+        {"hour": hour, "efforts": e, "athletes": a, "observed": n, "avg_efforts": round(e / n, 2) if n else 0}
+        for hour, (e, a, n) in totals.items()
+    ]
+
+def efforts_by_weekday(conn, segment_id, tz):
+    """Total and average new efforts per local weekday (averaged over observed days)."""
+    totals = {day: [0, 0, set()] for day in range(7)}
+    for local, efforts, athletes in _local_hours(conn, segment_id, tz):
+        total = totals[local.weekday()]
+        total[0] += efforts
+        total[1] += athletes
+        total[2].add(local.date())
+    return [
+        {"weekday": WEEKDAYS[day], "efforts": e, "athletes": a, "observed": len(days),
+         "avg_efforts": round(e / len(days), 2) if days else 0}
+        for day, (e, a, days) in totals.items()
+    ]
+
+def busiest_windows(conn, segment_id, tz, limit=BUSIEST_LIMIT):
+    """The hours with the most new efforts."""
+    rows = conn.execute("""
+        SELECT bucket, effort_delta, athlete_delta FROM segment_rollup_hourly
+        WHERE segment_id = ?
+        ORDER BY effort_delta DESC, bucket DESC
+        LIMIT ?
+    """, (segment_id, limit)).fetchall()
+    result = []
+    for bucket, efforts, athletes in rows:
+        utc = datetime.datetime.strptime(bucket, segment_monitor.TIMESTAMP_FORMAT).replace(tzinfo=pytz.utc)
+        result.append({"start": utc.astimezone(tz).isoformat(), "efforts": efforts, "athletes": athletes})
+    return result
+
+def weekly_growth(conn, segment_id, weeks=WEEKS):
+    """New efforts per (UTC, Monday-based) week and the change from the week before."""
+    rows = conn.execute("""
+        SELECT date(bucket, 'weekday 0', '-6 days') AS week, SUM(effort_delta), SUM(athlete_delta)
+        FROM segment_rollup_daily
+        WHERE segment_id = ?
+        GROUP BY week
+        ORDER BY week DESC
+        LIMIT ?
+    """, (segment_id, weeks + 1)).fetchall()
+    rows.reverse()
+    result = []
+    for i, (week, efforts, athletes) in enumerate(rows):
+        previous = rows[i - 1][1] if i else None
+        growth = round((efforts - previous) * 100.0 / previous, 1) if previous else None
+        result.append({"week": week, "efforts": efforts, "athletes": athletes, "growth_pct": growth})
+    # The extra leading week only supplies the first growth figure
+    return result[-weeks:]
+
+def segment_stats(segment_id, by="hour", conn=None):
+    """Rows answering one `by` question (see STATS_KINDS) from the rollups."""
+    if by not in STATS_KINDS:
+        raise ValueError(f"Unknown stats grouping {by!r} (use one of {', '.join(STATS_KINDS)})")
+    tz = pytz.timezone(STATS_TIMEZONE)
+    own_conn = conn is None
+    conn = conn or segment_monitor.init_segment_db()
+    try:
+        if by == "hour":
+            return efforts_by_hour(conn, segment_id, tz)
+        if by == "weekday":
+            return efforts_by_weekday(conn, segment_id, tz)
+        if by == "busiest":
+            return busiest_windows(conn, segment_id, tz)
+        return weekly_growth(conn, segment_id)
+    finally:
+        if own_conn:
+            conn.close()
+
+# --- OUTPUT ---
+def format_rows(rows, fmt="json"):
+    if fmt == "json":
+        return json.dumps(rows, indent=2)
+    if fmt == "csv":
+        out = io.StringIO()
+        if rows:
+            writer = csv.DictWriter(out, fieldnames=list(rows[0]), lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(rows)
+        return out.getvalue()
+    raise ValueError(f"Unknown output format {fmt!r} (use json or csv)")
+
+def print_segment_stats(args):
+    """CLI: <segment_id> [--by hour|weekday|busiest|week] [--format json|csv]"""
+    segment_id = int(args[0])
+    options = dict(zip(args[1::2], args[2::2]))
+    rows = segment_stats(segment_id, options.get("--by", "hour"))
+    print(format_rows(rows, options.get("--format", "json")).rstrip("\n"))
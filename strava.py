@@ -1,59 +1,56 @@
 import os
-import requests
-import polyline
-import xml.etree.ElementTree as ET
+import io
 import datetime
-import math
-import json
-import pytz
 import re
 import sys
-import sqlite3
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
+import strava_client
+import activity_store
+import metrics
+import tracing
+
+# pytz, the GPX/polyline modules (NumPy) and the subcommand modules are
+# imported where they are used, so cron runs only load what they need
+
 load_dotenv()
 
 # --- CONFIGURATION ---
-STRAVA_ACCESS_TOKEN = os.getenv("STRAVA_ACCESS_TOKEN")
-STRAVA_REFRESH_TOKEN = os.getenv("STRAVA_REFRESH_TOKEN")
-CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
-CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
-WEBHOOK_URL = os.getenv("WEBHOOK_URL")
-
 # Segment IDs for the "Iron Chain" Streak (Cycling)
 BIG_SEGMENT_ID = 10792500  
 SMALL_SEGMENT_ID = 2517149 
 
-# Path to save the GPX file
+# Activity types handled by each streak engine (lower-case Strava types)
+RUN_TYPES = ("run", "nordicski")
+RIDE_TYPES = ("ride",)
+STREAK_KINDS = {"run": RUN_TYPES, "ride": RIDE_TYPES}
+
+# Worker threads for batch mode (detail fetches + GPX writes)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+
+# Seconds a fetched activity detail is reused before revalidating (ETag)
+ACTIVITY_CACHE_TTL = int(os.getenv("ACTIVITY_CACHE_TTL", "900"))
+
+# Build GPX from the full-resolution Streams API (real <time>/<ele>) instead
+# of the simplified summary polyline; costs one extra request per activity
+GPX_HIGH_FIDELITY = os.getenv("GPX_HIGH_FIDELITY", "").lower() in {"1", "true", "yes"}
+
+# Path to save the GPX file (required by the commands that write GPX)
 SAVE_PATH = os.getenv("SAVE_PATH")
-if not SAVE_PATH:
-    raise ValueError("SAVE_PATH not set in .env")
 
-# --- HELPER FUNCTIONS ---
+def require_save_path():
+    if not SAVE_PATH:
+        raise ValueError("SAVE_PATH not set in .env")
 
-def refresh_access_token():
-    global STRAVA_ACCESS_TOKEN, STRAVA_REFRESH_TOKEN 
-    url = "https://www.strava.com/api/v3/oauth/token"
-    payload = {
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "refresh_token": STRAVA_REFRESH_TOKEN,
-        "grant_type": "refresh_token"
-    }
-    response = requests.post(url, data=payload)
-    if response.status_code == 200:
-        data = response.json()
-        STRAVA_ACCESS_TOKEN = data["access_token"]
-        STRAVA_REFRESH_TOKEN = data["refresh_token"] 
-        print("Token refreshed successfully!")
-    else:
-        print(f"Error refreshing token: {response.status_code}, {response.text}")
+# --- HELPER FUNCTIONS ---
 
 def update_activity_name(activity_id, new_name):
-    url = f"https://www.strava.com/api/v3/activities/{activity_id}"
-    headers = {"Authorization": f"Bearer {STRAVA_ACCESS_TOKEN}"}
     payload = {"name": new_name}
-    response = requests.put(url, headers=headers, data=payload)
+    response = strava_client.put(f"/activities/{activity_id}", data=payload)
     if response.status_code == 200:
         print(f"Activity {activity_id} renamed to: {new_name}")
         return True
@@ -62,130 +59,135 @@ def update_activity_name(activity_id, new_name):
         return False
 
 def get_recent_activities():
-    url = "https://www.strava.com/api/v3/athlete/activities"
-    headers = {"Authorization": f"Bearer {STRAVA_ACCESS_TOKEN}"}
+    import pytz
     local_tz = pytz.timezone("Europe/Vienna") 
     one_hour_ago = datetime.datetime.now(local_tz) - datetime.timedelta(hours=14)
     one_hour_ago_utc = one_hour_ago.astimezone(pytz.utc).timestamp()
-    params = {"after": one_hour_ago_utc}
-    
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code == 401:
-        print("Access token expired! Refreshing...")
-        refresh_access_token()
-        headers["Authorization"] = f"Bearer {STRAVA_ACCESS_TOKEN}"
-        response = requests.get(url, headers=headers, params=params)
-    
-    if response.status_code != 200:
-        print(f"Error: {response.status_code}, {response.text}")
+
+    # Only the delta since the last run goes over the wire
+    if activity_store.sync_activities() is None:
         return []
-    return response.json()
+    return activity_store.get_activities_since(int(one_hour_ago_utc))
 
 def get_activity_data(activity_id):
-    url = f"https://www.strava.com/api/v3/activities/{activity_id}"
-    headers = {"Authorization": f"Bearer {STRAVA_ACCESS_TOKEN}"}
-    response = requests.get(url, headers=headers)
-    if response.status_code == 401:
-        refresh_access_token()
-        headers["Authorization"] = f"Bearer {STRAVA_ACCESS_TOKEN}"
-        response = requests.get(url, headers=headers)
+    response = strava_client.get(f"/activities/{activity_id}", cache_ttl=ACTIVITY_CACHE_TTL)
     if response.status_code != 200:
         return None
     return response.json()
 
+def get_activity_streams(activity_id):
+    params = {"keys": "latlng,time,altitude", "key_by_type": "true"}
+    response = strava_client.get(
+        f"/activities/{activity_id}/streams", params=params,
+        priority=strava_client.PRIORITY_LOW, cache_ttl=ACTIVITY_CACHE_TTL
+    )
+    if response.status_code != 200:
+        print(f"Error fetching streams for {activity_id}: {response.status_code}, {response.text}")
+        return None
+    import gpx_writer
+    return gpx_writer.stream_arrays(response.json())
+
+# --- STREAK STATE HELPERS ---
+def activity_local_date(activity):
+    import pytz
+    start_time = datetime.datetime.strptime(activity["start_date"], "%Y-%m-%dT%H:%M:%SZ")
+    timezone_str = activity.get("timezone", "UTC")
+    timezone_name = timezone_str.split(" ")[-1] if len(timezone_str.split(" ")) > 1 else "UTC"
+    tz = pytz.timezone(timezone_name)
+    return start_time.replace(tzinfo=pytz.utc).astimezone(tz).date()
+
+def activity_monday(activity):
+    dt = datetime.datetime.strptime(activity["start_date"], "%Y-%m-%dT%H:%M:%SZ")
+    return dt.date() - datetime.timedelta(days=dt.weekday())
+
+def count_streak_loops(activity):
+    seg_ids = [e['segment']['id'] for e in activity.get('segment_efforts', [])]
+    return seg_ids.count(BIG_SEGMENT_ID), seg_ids.count(SMALL_SEGMENT_ID)
+
+def streak_period(kind, activity):
+    if kind == "run":
+        return activity_local_date(activity).isoformat()
+    return activity_monday(activity).isoformat()
+
+def rebuild_streak_state(kind):
+    """Reconstruct one streak-state row from the newest counted activity in the store."""
+    pattern = re.compile(r"#(\d+)")
+    for act in activity_store.get_history(STREAK_KINDS[kind]):
+        match = pattern.search(act.get("name", ""))
+        if not match:
+            continue
+        big_loops = small_loops = None
+        if kind == "ride":
+            details = get_activity_data(act["id"])
+            if details:
+                big_loops, small_loops = count_streak_loops(details)
+        return activity_store.save_streak_state(
+            kind, int(match.group(1)), streak_period(kind, act), act["id"], big_loops, small_loops
+        )
+    activity_store.clear_streak_state(kind)
+    return None
+
+def rebuild_all_streak_state():
+    import backfill
+    print("--- Rebuilding streak state from full history ---")
+    if backfill.backfill_history() is None:
+        return
+    for kind in STREAK_KINDS:
+        state = rebuild_streak_state(kind)
+        if state:
+            print(f"{kind}: #{state['last_counter']:03d} on {state['last_period']} (activity {state['activity_id']})")
+        else:
+            print(f"{kind}: no streak found in history")
+
 # --- LOGIC ENGINE 1: RUNNING / NORDIC SKI (Daily Streak) ---
 def calculate_run_streak(current_activity):
     print("--- Executing RUN/SKI Logic ---")
     
     # 1. Get current date (Local)
-    start_time = datetime.datetime.strptime(current_activity["start_date"], "%Y-%m-%dT%H:%M:%SZ")
-    timezone_str = current_activity.get("timezone", "UTC")
-    timezone_name = timezone_str.split(" ")[-1] if len(timezone_str.split(" ")) > 1 else "UTC"
-    tz = pytz.timezone(timezone_name)
-    current_activity_date = start_time.replace(tzinfo=pytz.utc).astimezone(tz).date()
+    current_activity_date = activity_local_date(current_activity)
 
-    # 2. Fetch History (Look deeper to ignore Bike rides)
-    url = "https://www.strava.com/api/v3/athlete/activities"
-    headers = {"Authorization": f"Bearer {STRAVA_ACCESS_TOKEN}"}
-    params = {"per_page": 100} # Increased to 100 to see past bike rides
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code != 200: return None
-    activities = response.json()
+    # 2. Look up the last counted run (seeded from the store on first use)
+    with tracing.span("streak_state", kind="run"):
+        state = activity_store.get_streak_state("run") or rebuild_streak_state("run")
+    if not state:
+        return None
 
-    # 3. Find Last Run
-    pattern = re.compile(r"#(\d+)")
-    for act in activities:
-        if str(act["id"]) == str(current_activity["id"]): continue
-        
-        # STRICT FILTER: Only look at runs/skis
-        if act.get("type", "").lower() not in {"run", "nordicski"}: continue
+    # 3. Compare with the last counted day
+    last_counter = state["last_counter"]
+    act_local_date = datetime.date.fromisoformat(state["last_period"])
+    days_diff = (current_activity_date - act_local_date).days
 
-        match = pattern.search(act.get("name", ""))
-        if match:
-            last_counter = int(match.group(1))
-            act_time = datetime.datetime.strptime(act["start_date"], "%Y-%m-%dT%H:%M:%SZ")
-            act_local_date = act_time.replace(tzinfo=pytz.utc).astimezone(tz).date()
-            days_diff = (current_activity_date - act_local_date).days
-
-            if days_diff == 1:
-                return last_counter + 1
-            elif days_diff == 0:
-                print("Already ran today.")
-                return None
-            else:
-                print(f"Streak broken! Last run was {days_diff} days ago.")
-                return None 
-    return None
+    if days_diff == 1:
+        return last_counter + 1
+    elif days_diff == 0:
+        print("Already ran today.")
+        return None
+    else:
+        print(f"Streak broken! Last run was {days_diff} days ago.")
+        return None 
 
 # --- LOGIC ENGINE 2: CYCLING (Weekly Segment Streak) ---
 def calculate_cycle_streak(current_activity):
     print("--- Executing CYCLING Logic ---")
 
     # 1. Check Segments in Current Ride
-    efforts = current_activity.get('segment_efforts', [])
-    current_seg_ids = [e['segment']['id'] for e in efforts]
-    big_loops = current_seg_ids.count(BIG_SEGMENT_ID)
-    small_loops = current_seg_ids.count(SMALL_SEGMENT_ID)
+    big_loops, small_loops = count_streak_loops(current_activity)
 
     if big_loops == 0 and small_loops == 0:
         print("No streak segments found in this ride.")
         return None
 
-    # 2. Fetch History
-    url = "https://www.strava.com/api/v3/athlete/activities"
-    headers = {"Authorization": f"Bearer {STRAVA_ACCESS_TOKEN}"}
-    params = {"per_page": 100} 
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code != 200: return None
-    activities = response.json()
-
-    pattern = re.compile(r"#(\d+)")
-    last_streak_ride_summary = None
-    last_count = 0
-
-    for act in activities:
-        if str(act["id"]) == str(current_activity["id"]): continue
-        
-        # STRICT FILTER: Only look at Rides
-        if act.get("type", "").lower() != "ride": continue
-
-        match = pattern.search(act.get("name", ""))
-        if match:
-            last_streak_ride_summary = act
-            last_count = int(match.group(1))
-            break 
-
-    if not last_streak_ride_summary:
+    # 2. Look up the last counted ride (seeded from the store on first use)
+    with tracing.span("streak_state", kind="ride"):
+        state = activity_store.get_streak_state("ride") or rebuild_streak_state("ride")
+    if not state:
         print("No previous cycling streak found.")
         return None 
+    last_count = state["last_counter"]
 
     # 3. Calculate Debt
-    def get_monday(dt_str):
-        dt = datetime.datetime.strptime(dt_str, "%Y-%m-%dT%H:%M:%SZ")
-        return dt.date() - datetime.timedelta(days=dt.weekday())
-
-    curr_monday = get_monday(current_activity["start_date"])
-    last_monday = get_monday(last_streak_ride_summary["start_date"])
+    curr_monday = activity_monday(current_activity)
+    last_monday = datetime.date.fromisoformat(state["last_period"])
     weeks_diff = (curr_monday - last_monday).days // 7
     weeks_missed = max(0, weeks_diff - 1)
 
@@ -203,156 +205,347 @@ def calculate_cycle_streak(current_activity):
     elif small_loops >= req_small:
         is_success = True
     elif weeks_missed == 0 and small_loops == 1 and big_loops == 0:
-        # Weak Link Check
-        last_streak_details = get_activity_data(last_streak_ride_summary["id"])
-        if last_streak_details:
-            prev_ids = [e['segment']['id'] for e in last_streak_details.get('segment_efforts', [])]
-            if prev_ids.count(BIG_SEGMENT_ID) >= 1 or prev_ids.count(SMALL_SEGMENT_ID) >= 2:
-                is_success = True
+        # Weak Link Check - loop counts are stored with the state; only fetch
+        # the previous ride if they are unknown
+        prev_big, prev_small = state["big_loops"], state["small_loops"]
+        if prev_big is None or prev_small is None:
+            with tracing.span("weak_link_fetch", activity_id=state["activity_id"]):
+                last_streak_details = get_activity_data(state["activity_id"])
+            if last_streak_details:
+                prev_big, prev_small = count_streak_loops(last_streak_details)
+        if (prev_big or 0) >= 1 or (prev_small or 0) >= 2:
+            is_success = True
 
     if is_success:
         return last_count + weeks_missed + 1
     return None
 
 # --- GPX GENERATOR (Shared) ---
-def generate_gpx(activity):
+def write_activity_gpx(activity, out, high_fidelity=False):
+    """
+    Stream the activity's track to `out`. Returns the source used
+    ("streams" or "polyline"), or None if the activity has no polyline.
+    """
     poly = activity.get("map", {}).get("summary_polyline", "")
     if not poly: return None
-    points = polyline.decode(poly)
-    start_time = datetime.datetime.strptime(activity["start_date"], "%Y-%m-%dT%H:%M:%SZ")
-    
-    gpx = ET.Element("gpx", version="1.1", creator="StravaGPXExporter", xmlns="http://www.topografix.com/GPX/1/1")
-    trk = ET.SubElement(gpx, "trk")
-    ET.SubElement(trk, "name").text = activity.get("name", "")
-    trkseg = ET.SubElement(trk, "trkseg")
-    
-    for i, (lat, lon) in enumerate(points):
-        timestamp = start_time + datetime.timedelta(seconds=i * (activity["elapsed_time"] / len(points)))
-        trkpt = ET.SubElement(trkseg, "trkpt", lat=str(lat), lon=str(lon))
-        ET.SubElement(trkpt, "time").text = timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
-    
-    return ET.tostring(gpx, encoding="utf-8").decode("utf-8")
-
-# --- SEGMENT MONITORING ---
-def init_segment_db():
-    conn = sqlite3.connect("segment_history.db")
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS segment_efforts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            segment_id INTEGER NOT NULL,
-            effort_count INTEGER NOT NULL,
-            athlete_count INTEGER,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    return conn
-
-def get_segment_data(segment_id):
-    url = f"https://www.strava.com/api/v3/segments/{segment_id}"
-    headers = {"Authorization": f"Bearer {STRAVA_ACCESS_TOKEN}"}
-    response = requests.get(url, headers=headers)
-    if response.status_code == 401:
-        refresh_access_token()
-        headers["Authorization"] = f"Bearer {STRAVA_ACCESS_TOKEN}"
-        response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        print(f"Error fetching segment {segment_id}: {response.status_code}, {response.text}")
-        return None
-    return response.json()
+    if high_fidelity:
+        with tracing.span("fetch_streams"):
+            streams = get_activity_streams(activity["id"])
+        if streams:
+            write_stream_gpx(activity, streams, out)
+            return "streams"
+        print(f"No streams for {activity['id']}, using summary polyline")
+    import gpx_writer
+    import polyline_batch
+    with tracing.span("decode_polyline"):
+        lats, lons, _ = polyline_batch.decode_many([poly])
+    with tracing.span("gpx_build", points=len(lats)):
+        out.write(gpx_writer.GPX_OPEN)
+        gpx_writer.write_summary_track(out, activity, polyline_batch.as_floats(lats), polyline_batch.as_floats(lons))
+        out.write(gpx_writer.GPX_CLOSE)
+    return "polyline"
+
+def write_stream_gpx(activity, streams, out):
+    import gpx_writer
+    start_epoch = activity_store.parse_start_epoch(activity["start_date"])
+    times = gpx_writer.stream_timestamps(start_epoch, streams["time"])
+    name = activity.get("name", "")
+    if streams["altitude"] is not None:
+        points = zip(streams["lat"], streams["lon"], streams["altitude"], times)
+        gpx_writer.write_gpx(out, name, points, elevation=True)
+    else:
+        gpx_writer.write_gpx(out, name, zip(streams["lat"], streams["lon"], times))
 
-def record_segment_efforts(segment_id):
-    data = get_segment_data(segment_id)
-    if not data:
-        return
-    
-    effort_count = data.get("effort_count")
-    athlete_count = data.get("athlete_count")
-    
-    conn = init_segment_db()
-    
-    last_effort = conn.execute(
-        "SELECT effort_count FROM segment_efforts WHERE segment_id = ? ORDER BY timestamp DESC LIMIT 1",
-        (segment_id,)
-    ).fetchone()
-    
-    diff = None
-    if last_effort:
-        diff = effort_count - last_effort[0]
-        print(f"Effort difference: {diff}")
-    
-    conn.execute(
-        "INSERT INTO segment_efforts (segment_id, effort_count, athlete_count) VALUES (?, ?, ?)",
-        (segment_id, effort_count, athlete_count)
-    )
-    conn.commit()
-    print(f"Recorded segment {segment_id}: {effort_count} efforts, {athlete_count} athletes")
-    conn.close()
-    
-    if diff is not None and diff > 2:
-        send_to_webhook(diff, segment_id)
-
-def send_to_webhook(diff, segment_id):
-    webhook_url = os.getenv("WEBHOOK_URL")
-    payload = {
-        "effort_diff": diff,
-        "segment_id": segment_id
-    }
-    try:
-        response = requests.post(webhook_url, json=payload, headers={"Content-Type": "application/json"})
-        if response.status_code in (200, 201, 202):
-            print(f"Sent {diff} to webhook")
-        else:
-            print(f"Webhook error: {response.status_code}, {response.text}")
-    except Exception as e:
-        print(f"Webhook request failed: {e}")
+def generate_gpx(activity, high_fidelity=False):
+    buffer = io.StringIO()
+    if not write_activity_gpx(activity, buffer, high_fidelity):
+        return None
+    return buffer.getvalue()
 
 # --- MAIN EXECUTION BLOCK ---
-def process_activity(activity_id):
-    activity_data = get_activity_data(activity_id)
-    if not activity_data: 
-        print(f"Could not fetch {activity_id}")
+def catch_up_streak_state(activity_data):
+    """
+    Advance the stored streak state to an activity that already carries a
+    newer counter: the rename was applied but its state update was lost, or
+    it came from another checkout with its own store.
+    """
+    activity_type = activity_data.get("type", "").lower()
+    kind = "run" if activity_type in RUN_TYPES else "ride" if activity_type in RIDE_TYPES else None
+    match = re.search(r"#(\d+)", activity_data.get("name", ""))
+    if not kind or not match:
         return
-
+    # No state yet: rebuild_streak_state finds the newest counter when needed
+    state = activity_store.get_streak_state(kind)
+    counter = int(match.group(1))
+    period = streak_period(kind, activity_data)
+    if not state or counter <= state["last_counter"] or period < state["last_period"]:
+        return
+    big_loops = small_loops = None
+    if kind == "ride":
+        big_loops, small_loops = count_streak_loops(activity_data)
+    activity_store.save_streak_state(kind, counter, period, activity_data["id"], big_loops, small_loops)
+    print(f"Streak state caught up: {kind} #{counter:03d} on {period}")
+
+def apply_streak_rename(activity_data):
+    activity_id = activity_data["id"]
     original_name = activity_data.get("name", "")
     activity_type = activity_data.get("type", "").lower()
     
     # Check if we have already renamed this specific activity
     if re.search(r"#\d{1,3}", original_name):
         print(f"Activity {activity_id} already has a streak counter.")
-    else:
-        new_counter = None
-        
-        # === ROUTING LOGIC ===
-        if activity_type in {"run", "nordicski"}:
+        catch_up_streak_state(activity_data)
+        return
+
+    new_counter = None
+    streak_kind = None
+    
+    # === ROUTING LOGIC ===
+    if activity_type in RUN_TYPES:
+        streak_kind = "run"
+        with tracing.span("streak", kind=streak_kind):
             new_counter = calculate_run_streak(activity_data)
-        elif activity_type == "ride":
+    elif activity_type in RIDE_TYPES:
+        streak_kind = "ride"
+        with tracing.span("streak", kind=streak_kind):
             new_counter = calculate_cycle_streak(activity_data)
-        
-        # Apply Rename
-        if new_counter is not None:
-            counter_str = f"#{new_counter:03d}"
-            new_name = f"{counter_str} {original_name}"
-            if update_activity_name(activity_id, new_name):
-                activity_data["name"] = new_name
-
-    # Generate GPX (For all types)
-    gpx_data = generate_gpx(activity_data)
-    if gpx_data:
-        os.makedirs(SAVE_PATH, exist_ok=True)
-        file_path = os.path.join(SAVE_PATH, f"{activity_id}.gpx")
-        with open(file_path, "w") as file:
-            file.write(gpx_data)
-        print(f"GPX file saved as {file_path}")
+    
+    # Apply Rename
+    if new_counter is not None:
+        counter_str = f"#{new_counter:03d}"
+        new_name = f"{counter_str} {original_name}"
+        with tracing.span("update_name"):
+            renamed = update_activity_name(activity_id, new_name)
+        if renamed:
+            metrics.inc("strava_streak_renames_total", kind=streak_kind)
+            activity_data["name"] = new_name
+            # Advance the streak state together with the stored activity
+            big_loops = small_loops = None
+            if streak_kind == "ride":
+                big_loops, small_loops = count_streak_loops(activity_data)
+            activity_store.record_streak_rename(
+                streak_kind, activity_data, new_counter,
+                streak_period(streak_kind, activity_data), big_loops, small_loops
+            )
+
+def gpx_source_hash(activity_data, source):
+    source = "\0".join([
+        activity_data.get("map", {}).get("summary_polyline", ""),
+        activity_data.get("name", ""),
+        activity_data["start_date"],
+        str(activity_data.get("elapsed_time")),
+        source,
+    ])
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+def save_gpx(activity_data, high_fidelity=GPX_HIGH_FIDELITY):
+    # Generate GPX (For all types), streamed straight into the file
+    activity_id = activity_data["id"]
+    if not activity_data.get("map", {}).get("summary_polyline"):
+        return
+
+    require_save_path()
+    file_path = os.path.join(SAVE_PATH, f"{activity_id}.gpx")
+    # Every rewrite makes Dawarich re-import the file, so only write when
+    # the track, name or start time changed since the last export (or the
+    # file is gone)
+    wanted_hash = gpx_source_hash(activity_data, "streams" if high_fidelity else "polyline")
+    if activity_store.get_export_hash(activity_id) == wanted_hash and os.path.exists(file_path):
+        print(f"GPX for {activity_id} unchanged, skipping")
+        metrics.inc("strava_gpx_exports_total", result="unchanged")
+        return
+
+    os.makedirs(SAVE_PATH, exist_ok=True)
+    # Write a hidden temp file and rename it, so the watcher never sees a partial GPX
+    tmp_path = os.path.join(SAVE_PATH, f".{activity_id}.gpx.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tracing.span("gpx_write"), open(tmp_path, "w") as file:
+            source = write_activity_gpx(activity_data, file, high_fidelity)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Hash what was written: a polyline fallback doesn't match the streams
+    # hash, so the next run tries the full-resolution track again
+    activity_store.record_export(activity_id, gpx_source_hash(activity_data, source), file_path)
+    metrics.inc("strava_gpx_exports_total", result="written")
+    print(f"GPX file saved as {file_path}")
+
+def timed_stage(stage, func, *args):
+    with tracing.span(stage), metrics.timer("strava_activity_stage_seconds", stage=stage):
+        return func(*args)
+
+def process_activity(activity_id, high_fidelity=GPX_HIGH_FIDELITY):
+    with tracing.span("process_activity", activity_id=activity_id):
+        _process_activity(activity_id, high_fidelity)
+
+def _process_activity(activity_id, high_fidelity):
+    activity_data = timed_stage("fetch", get_activity_data, activity_id)
+    if not activity_data: 
+        print(f"Could not fetch {activity_id}")
+        metrics.inc("strava_activities_processed_total", result="fetch_failed")
+        return
+
+    # Keeps the history current when activities arrive by push, not list sync
+    timed_stage("store", activity_store.upsert_activities, [activity_data])
+    timed_stage("rename", apply_streak_rename, activity_data)
+    timed_stage("gpx", save_gpx, activity_data, high_fidelity)
+    metrics.inc("strava_activities_processed_total", result="ok")
+
+# --- BATCH MODE ---
+def process_batch(activity_ids, workers=BATCH_WORKERS, high_fidelity=GPX_HIGH_FIDELITY):
+    """
+    Process many activities at once. Detail fetches and GPX writes run on a
+    bounded thread pool; streak renames depend on each other, so they are
+    applied one by one in start-date order.
+    """
+    activity_ids = list(dict.fromkeys(str(a) for a in activity_ids))
+    if not activity_ids:
+        print("No activities to process.")
+        return
+
+    import requests
+
+    def fetch(activity_id):
+        # A timeout or dropped connection fails one activity, not the batch
+        try:
+            return timed_stage("fetch", get_activity_data, activity_id)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching {activity_id}: {e}")
+            return None
+
+    print(f"Processing {len(activity_ids)} activities with {workers} workers")
+    with tracing.span("process_batch", activities=len(activity_ids)), ThreadPoolExecutor(max_workers=workers) as pool:
+        fetched = list(pool.map(fetch, activity_ids))
+
+        activities = []
+        for activity_id, activity_data in zip(activity_ids, fetched):
+            if activity_data:
+                activities.append(activity_data)
+            else:
+                print(f"Could not fetch {activity_id}")
+                metrics.inc("strava_activities_processed_total", result="fetch_failed")
+        activities.sort(key=lambda a: a["start_date"])
+
+        gpx_jobs = {}
+        for activity_data in activities:
+            try:
+                timed_stage("rename", apply_streak_rename, activity_data)
+            except requests.exceptions.RequestException as e:
+                # The next run retries the rename; the GPX is still written
+                print(f"Streak rename failed for {activity_data['id']}: {e}")
+            gpx_jobs[pool.submit(timed_stage, "gpx", save_gpx, activity_data, high_fidelity)] = activity_data["id"]
+
+        for job in as_completed(gpx_jobs):
+            try:
+                job.result()
+                metrics.inc("strava_activities_processed_total", result="ok")
+            except Exception as e:
+                # Disk errors, a stream fetch that timed out, a bad polyline:
+                # still collect the other activities' results
+                print(f"GPX write failed for {gpx_jobs[job]}: {e}")
+                metrics.inc("strava_activities_processed_total", result="gpx_failed")
+
+def read_activity_ids(file_path):
+    with open(file_path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+def get_activities_between(since=None, until=None):
+    """Stored activities between two local dates (YYYY-MM-DD, `until` exclusive; None = open)."""
+    import pytz
+    local_tz = pytz.timezone("Europe/Vienna")
+
+    def local_midnight_epoch(date_str):
+        day = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+        return int(local_tz.localize(day).timestamp())
+
+    if activity_store.sync_activities() is None:
+        return []
+    start_epoch = local_midnight_epoch(since) if since else 0
+    end_epoch = local_midnight_epoch(until) if until else None
+    return activity_store.get_activities_since(start_epoch, end_epoch)
+
+def get_activity_ids_between(since, until=None):
+    return [a["id"] for a in get_activities_between(since, until)]
 
 # Script Entry Point
-if len(sys.argv) > 1:
-    if sys.argv[1] == "--segment":
-        segment_id = int(sys.argv[2]) if len(sys.argv) > 2 else BIG_SEGMENT_ID
-        record_segment_efforts(segment_id)
+# Commands that keep running; they dump metrics periodically, not just at exit
+DAEMON_COMMANDS = ("--monitor", "--serve")
+
+def main(argv=None):
+    argv = tracing.take_trace_flag(sys.argv[1:] if argv is None else argv)
+    if "--profile" in argv:
+        # --profile <any command>: the same run under cProfile and tracemalloc,
+        # report written next to the GPX output
+        import profiling
+        argv = [a for a in argv if a != "--profile"]
+        return profiling.profile_call("strava", main, argv, directory=SAVE_PATH)
+    command = argv[0] if argv else None
+    # One metrics file per command, so cron jobs don't overwrite each other's
+    job = "strava_" + command[2:].replace("-", "_") if command and command.startswith("--") else "strava"
+    stop_dumps = threading.Event()
+    if command in DAEMON_COMMANDS:
+        metrics.dump_every(job, metrics.METRICS_INTERVAL, stop_dumps)
+    start = time.perf_counter()
+    try:
+        run_command(command, argv)
+    finally:
+        stop_dumps.set()
+        metrics.set_gauge("strava_run_duration_seconds", time.perf_counter() - start)
+        metrics.dump(job)
+
+def run_command(command, argv):
+    if command == "--rebuild-streaks":
+        rebuild_all_streak_state()
+    elif command == "--backfill":
+        import backfill
+        backfill.backfill_history(restart="--restart" in argv[1:])
+    elif command == "--export":
+        # --export <file.gpx|file.ndjson[.gz]> [since] [until]
+        import bulk_export
+        since = argv[2] if len(argv) > 2 else None
+        until = argv[3] if len(argv) > 3 else None
+        bulk_export.export_tracks(argv[1], get_activities_between(since, until))
+    elif command == "--segment":
+        import segment_monitor
+        segment_id = int(argv[1]) if len(argv) > 1 else BIG_SEGMENT_ID
+        segment_monitor.record_segment_efforts(segment_id)
+    elif command == "--monitor":
+        # --monitor [segment_id ...]; defaults to SEGMENT_IDS, then BIG_SEGMENT_ID
+        import segment_monitor
+        segment_ids = [int(a) for a in argv[1:]] or segment_monitor.SEGMENT_IDS or [BIG_SEGMENT_ID]
+        segment_monitor.monitor(segment_ids)
+    elif command == "--segment-stats":
+        # --segment-stats <segment_id> [--by hour|weekday|busiest|week] [--format json|csv]
+        import segment_stats
+        segment_stats.print_segment_stats(argv[1:])
+    elif command == "--serve":
+        # --serve [port]: process activities as Strava push events arrive
+        import push_receiver
+        require_save_path()
+        port = int(argv[1]) if len(argv) > 1 else push_receiver.PUSH_PORT
+        push_receiver.serve(process_activity, port=port)
+    elif command == "--subscribe":
+        import push_receiver
+        push_receiver.create_subscription(argv[1])
+    elif command == "--batch":
+        require_save_path()
+        process_batch(argv[1:])
+    elif command == "--batch-file":
+        require_save_path()
+        process_batch(read_activity_ids(argv[1]))
+    elif command == "--since":
+        require_save_path()
+        until = argv[2] if len(argv) > 2 else None
+        process_batch(get_activity_ids_between(argv[1], until))
+    elif command:
+        require_save_path()
+        process_activity(command)
     else:
-        process_activity(sys.argv[1])
-else:
-    recent_activities = get_recent_activities()
-    for activity in recent_activities:
-        process_activity(activity["id"])
\ No newline at end of file
+        require_save_path()
+        recent_activities = get_recent_activities()
+        process_batch([activity["id"] for activity in recent_activities])
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,17 @@
 import os
 import sys
 import re
-import requests
 import datetime
 import pytz
 from dotenv import load_dotenv
 
-load_dotenv()
+import strava_client
+import metrics
+import tracing
 
-# Strava API credentials
-STRAVA_ACCESS_TOKEN = os.getenv("STRAVA_ACCESS_TOKEN")
-STRAVA_REFRESH_TOKEN = os.getenv("STRAVA_REFRESH_TOKEN")
-CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
-CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
+load_dotenv()
 
-# Audiobookshelf API credentials and server URL
-ABS_API_TOKEN = os.getenv("ABS_API_TOKEN")
-ABS_URL = os.getenv("ABS_URL")
+# Audiobookshelf settings live in abs_sessions.py
 
 # Last.fm credentials
 LASTFM_API_KEY = os.getenv("LASTFM_API_KEY")
@@ -26,28 +21,8 @@ LASTFM_API_URL = "https://ws.audioscrobbler.com/2.0/"
 # -------------------------
 # Strava helper functions
 # -------------------------
-def refresh_access_token():
-    global STRAVA_ACCESS_TOKEN, STRAVA_REFRESH_TOKEN
-    url = "https://www.strava.com/api/v3/oauth/token"
-    payload = {
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "refresh_token": STRAVA_REFRESH_TOKEN,
-        "grant_type": "refresh_token"
-    }
-    response = requests.post(url, data=payload)
-    if response.status_code == 200:
-        data = response.json()
-        STRAVA_ACCESS_TOKEN = data["access_token"]
-        STRAVA_REFRESH_TOKEN = data["refresh_token"]
-        print("Strava token refreshed successfully!")
-    else:
-        print(f"Error refreshing token: {response.status_code}, {response.text}")
-
 def get_last_activity():
     """Retrieve the most recent Strava activity (within the past 24 hours)."""
-    url = "https://www.strava.com/api/v3/athlete/activities"
-    headers = {"Authorization": f"Bearer {STRAVA_ACCESS_TOKEN}"}
     local_tz = pytz.timezone("Europe/Vienna")
     twenty_four_hours_ago = datetime.datetime.now(local_tz) - datetime.timedelta(hours=24)
     twenty_four_hours_ago_utc = twenty_four_hours_ago.astimezone(pytz.utc).timestamp()
@@ -55,12 +30,7 @@ def get_last_activity():
     # Increase per_page to ensure we get all activities in the window
     params = {"after": twenty_four_hours_ago_utc, "per_page": 30}
     
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code == 401:
-        print("Strava token expired! Refreshing...")
-        refresh_access_token()
-        headers["Authorization"] = f"Bearer {STRAVA_ACCESS_TOKEN}"
-        response = requests.get(url, headers=headers, params=params)
+    response = strava_client.get("/athlete/activities", params=params)
     if response.status_code != 200:
         print("Error getting recent activities:", response.status_code, response.text)
         return None
@@ -75,10 +45,8 @@ def get_last_activity():
 
 def update_activity(activity_id, new_title, new_description):
     """Update the activity's name and description on Strava."""
-    url = f"https://www.strava.com/api/v3/activities/{activity_id}"
-    headers = {"Authorization": f"Bearer {STRAVA_ACCESS_TOKEN}"}
     payload = {"name": new_title, "description": new_description}
-    response = requests.put(url, headers=headers, data=payload)
+    response = strava_client.put(f"/activities/{activity_id}", data=payload)
     if response.status_code == 200:
         print(f"Activity {activity_id} updated successfully.")
         return True
@@ -110,64 +78,36 @@ def print_strava_activity_debug(activity):
 # -------------------------
 def get_abs_session_during_activity(activity):
     """
-    Query ABS endpoint /api/me/listening-sessions and check for a session whose
-    time window overlaps with the Strava activity's timeframe.
+    Bring the local ABS session cache up to date (only sessions newer than
+    its high-water mark are downloaded) and look for a session whose time
+    window overlaps with the Strava activity's timeframe.
     """
-    url = f"{ABS_URL}/api/me/listening-sessions"
-    headers = {"Authorization": f"Bearer {ABS_API_TOKEN}"}
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        print("Error fetching ABS sessions:", response.status_code, response.text)
-        return None
-    data = response.json()
-    sessions = data.get("sessions", [])
-    if not sessions:
-        return None
+    import abs_sessions
+    abs_sessions.sync_sessions()
 
     # Correctly parse the activity's start time as UTC.
     activity_start = datetime.datetime.strptime(activity["start_date"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=pytz.utc).timestamp()
     activity_end = activity_start + activity.get("elapsed_time", 0)
-
-    abs_tz = pytz.timezone("Europe/Vienna")
-    
-    for session in sessions:
-        session_start_dt = datetime.datetime.fromtimestamp(session.get("startedAt", 0) / 1000.0, tz=abs_tz)
-        session_start_utc = session_start_dt.astimezone(pytz.utc).timestamp()
-        session_end_ms = session.get("updatedAt", session.get("startedAt", 0))
-        session_end_dt = datetime.datetime.fromtimestamp(session_end_ms / 1000.0, tz=abs_tz)
-        session_end_utc = session_end_dt.astimezone(pytz.utc).timestamp()
-        
-        # Check for overlap
-        if session_end_utc >= activity_start and session_start_utc <= activity_end:
-            return session
-    return None
+    return abs_sessions.find_overlapping_session(activity_start, activity_end)
 
 def print_last_three_sessions():
     """Debug helper for ABS sessions."""
-    url = f"{ABS_URL}/api/me/listening-sessions"
-    headers = {"Authorization": f"Bearer {ABS_API_TOKEN}"}
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        print("Error fetching ABS sessions:", response.status_code, response.text)
-        return
-    data = response.json()
-    sessions = data.get("sessions", [])
+    import abs_sessions
+    abs_sessions.sync_sessions()
+    sessions = abs_sessions.get_recent_sessions(3)
     if not sessions:
         print("No listening sessions found.")
         return
-    sessions = sorted(sessions, key=lambda s: s.get("startedAt", 0), reverse=True)
     abs_tz = pytz.timezone("Europe/Vienna")
     print("Last 3 listening sessions:")
-    for session in sessions[:3]:
-        start_dt = datetime.datetime.fromtimestamp(session.get("startedAt", 0) / 1000.0, tz=abs_tz)
-        start_dt_utc = start_dt.astimezone(pytz.utc)
-        end_ms = session.get("updatedAt", session.get("startedAt", 0))
-        end_dt = datetime.datetime.fromtimestamp(end_ms / 1000.0, tz=abs_tz)
-        end_dt_utc = end_dt.astimezone(pytz.utc)
+    for session in sessions:
+        start_epoch, end_epoch = abs_sessions.session_epochs(session)
+        start_dt_utc = datetime.datetime.fromtimestamp(start_epoch, tz=pytz.utc)
+        end_dt_utc = datetime.datetime.fromtimestamp(end_epoch, tz=pytz.utc)
         print(f"Session ID: {session.get('id', 'N/A')}")
-        print(f"  Start (ABS local): {start_dt.strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"  Start (ABS local): {start_dt_utc.astimezone(abs_tz).strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"  Start (UTC):       {start_dt_utc.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"  End (ABS local):   {end_dt.strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"  End (ABS local):   {end_dt_utc.astimezone(abs_tz).strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"  End (UTC):         {end_dt_utc.strftime('%Y-%m-%d %H:%M:%S')}")
         print("----------")
 
@@ -188,9 +128,10 @@ def get_lastfm_tracks_for_window(start_time, end_time):
         "format": "json",
         "limit": 200 
     }
-    
+
+    import requests
     try:
-        response = requests.get(LASTFM_API_URL, params=payload)
+        response = strava_client.get_session().get(LASTFM_API_URL, params=payload, timeout=strava_client.DEFAULT_TIMEOUT)
         response.raise_for_status() 
     except requests.exceptions.RequestException as e:
         print(f"Error connecting to Last.fm: {e}")
@@ -231,8 +172,20 @@ def get_lastfm_tracks_for_window(start_time, end_time):
 # -------------------------
 # Main function
 # -------------------------
-def main():
-    if len(sys.argv) > 1 and sys.argv[1] == "--debug-sessions":
+def main(argv=None):
+    argv = tracing.take_trace_flag(sys.argv[1:] if argv is None else argv)
+    if "--profile" in argv:
+        import profiling
+        argv = [a for a in argv if a != "--profile"]
+        return profiling.profile_call("strava_abs", main, argv)
+    try:
+        with metrics.timer("strava_abs_run_seconds"):
+            run(argv)
+    finally:
+        metrics.dump("strava_abs")
+
+def run(argv):
+    if argv and argv[0] == "--debug-sessions":
         print("Debugging ABS Sessions:")
         print_last_three_sessions()
         print("\nDebugging Last Strava Activity:")
@@ -242,18 +195,27 @@ def main():
         return
 
     # Retrieve the last Strava activity
-    last_activity = get_last_activity()
+    with tracing.span("get_last_activity"):
+        last_activity = get_last_activity()
     if not last_activity:
         print("No activity found to update.")
         return
+    annotate_activity(last_activity)
 
+def annotate_activity(last_activity):
+    """Add the overlapping ABS session or Last.fm tracks; returns True if the activity was updated."""
+    with tracing.span("annotate_activity", activity_id=last_activity["id"]):
+        return _annotate_activity(last_activity)
+
+def _annotate_activity(last_activity):
     activity_id = last_activity["id"]
     current_title = last_activity.get("name", "")
     current_description = last_activity.get("description", "")
     print(f"Found activity: {current_title} ({activity_id})")
 
     # --- Check for Audiobookshelf (ABS) session first ---
-    abs_session = get_abs_session_during_activity(last_activity)
+    with tracing.span("abs_lookup"):
+        abs_session = get_abs_session_during_activity(last_activity)
     
     if abs_session:
         print("Found overlapping ABS session.")
@@ -296,8 +258,9 @@ def main():
         else:
             new_title = current_title
         
-        update_activity(activity_id, new_title, new_description)
-        return
+        with tracing.span("update_activity"):
+            updated = update_activity(activity_id, new_title, new_description)
+        return count_annotation("abs", updated)
 
     # --- If no ABS session, check for Last.fm scrobbles ---
     print("No ABS session found. Checking Last.fm...")
@@ -307,9 +270,10 @@ def main():
         activity_end_dt = activity_start_dt + datetime.timedelta(seconds=last_activity.get("elapsed_time", 0))
     except Exception as e:
         print(f"Error parsing activity time: {e}")
-        return
+        return False
 
-    tracks = get_lastfm_tracks_for_window(activity_start_dt, activity_end_dt)
+    with tracing.span("lastfm_lookup"):
+        tracks = get_lastfm_tracks_for_window(activity_start_dt, activity_end_dt)
     
     if tracks:
         print(f"Found {len(tracks)} Last.fm scrobbles.")
@@ -329,10 +293,16 @@ def main():
         else:
             new_title = current_title
 
-        update_activity(activity_id, new_title, new_description)
-        return
+        with tracing.span("update_activity"):
+            updated = update_activity(activity_id, new_title, new_description)
+        return count_annotation("lastfm", updated)
 
     print("No ABS or Last.fm activity found for this timeframe.")
+    return count_annotation("none", False)
+
+def count_annotation(source, updated):
+    metrics.inc("strava_abs_annotations_total", source=source, result="updated" if updated else "not_updated")
+    return updated
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,212 @@
+import os
+import re
+import time
+from dotenv import load_dotenv
+
+import token_store
+import response_cache
+import metrics
+import tracing
+from rate_limit import RateLimiter, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
+CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
+
+API_BASE = "https://www.strava.com/api/v3"
+TOKEN_URL = f"{API_BASE}/oauth/token"
+
+# (connect, read) in seconds - a hung socket must never stall a cron run
+DEFAULT_TIMEOUT = (5, 30)
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+
+# Requests allowed back to back before pacing kicks in, the longest we
+# wait for budget, and how often a 429 is retried after backing off
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "30"))
+RATE_LIMIT_MAX_WAIT = int(os.getenv("RATE_LIMIT_MAX_WAIT", "900"))
+RATE_LIMIT_RETRIES = 2
+
+_session = None
+_tokens = None
+limiter = RateLimiter(burst=RATE_LIMIT_BURST, max_wait=RATE_LIMIT_MAX_WAIT)
+
+# --- SESSION ---
+def get_session():
+    """Return the shared keep-alive session (created on first use)."""
+    global _session
+    if _session is None:
+        # requests is the slowest import here; commands that never reach the
+        # network (e.g. --segment-stats) don't pay for it
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        session = requests.Session()
+        # Only retry failed connects; anything that reached the server is
+        # handled by the caller so PUTs are never sent twice. 429s with a
+        # Retry-After are left to _send_paced as well.
+        retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.5,
+                      respect_retry_after_header=False, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+def close_session():
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+
+# --- AUTH ---
+def refresh_access_token(stale_token=None):
+    """
+    Refresh the access token unless another thread or process already did
+    while we waited for the lock. Returns the current access token, or None
+    if the refresh failed.
+    """
+    global _tokens
+    with token_store.locked():
+        tokens = token_store.load_tokens()
+        if tokens.get("access_token") != stale_token and not token_store.is_expiring(tokens):
+            _tokens = tokens
+            return tokens["access_token"]
+
+        payload = {
+            "client_id": CLIENT_ID,
+            "client_secret": CLIENT_SECRET,
+            "refresh_token": tokens.get("refresh_token"),
+            "grant_type": "refresh_token"
+        }
+        import requests
+        try:
+            response = get_session().post(TOKEN_URL, data=payload, timeout=DEFAULT_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            print(f"Error refreshing token: {e}")
+            metrics.inc("strava_token_refreshes_total", result="error")
+            return None
+        if response.status_code != 200:
+            print(f"Error refreshing token: {response.status_code}, {response.text}")
+            metrics.inc("strava_token_refreshes_total", result="error")
+            return None
+        data = response.json()
+        tokens = {
+            "access_token": data["access_token"],
+            "refresh_token": data["refresh_token"],
+            "expires_at": data.get("expires_at", 0),
+        }
+        token_store.save_tokens(tokens)
+        _tokens = tokens
+        metrics.inc("strava_token_refreshes_total", result="ok")
+        print("Token refreshed successfully!")
+        return tokens["access_token"]
+
+def get_access_token():
+    """Current access token, refreshed proactively shortly before it expires."""
+    global _tokens
+    if _tokens is None:
+        _tokens = token_store.load_tokens()
+    if token_store.is_expiring(_tokens):
+        return refresh_access_token(_tokens.get("access_token")) or _tokens.get("access_token")
+    return _tokens["access_token"]
+
+# --- REQUESTS ---
+def endpoint_label(url):
+    """Metric label for a URL: /activities/123/streams -> /activities/{id}/streams."""
+    path = url[len(API_BASE):] if url.startswith(API_BASE) else url
+    return re.sub(r"/\d+", "/{id}", path.split("?", 1)[0])
+
+def _send_paced(method, url, priority, **kwargs):
+    """Send once the rate limiter allows it; back off and retry on 429."""
+    endpoint = endpoint_label(url)
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        with metrics.timer("strava_rate_limit_wait_seconds"):
+            limiter.acquire(priority)
+        with tracing.span(f"{method} {endpoint}") as span, \
+                metrics.timer("strava_api_request_seconds", method=method, endpoint=endpoint):
+            response = get_session().request(method, url, **kwargs)
+            span.set(status=response.status_code)
+        metrics.inc("strava_api_requests_total", method=method, endpoint=endpoint, status=response.status_code)
+        limiter.update(response.headers)
+        if response.status_code != 429 or attempt == RATE_LIMIT_RETRIES:
+            return response
+        wait = limiter.retry_after(response.headers)
+        if wait > RATE_LIMIT_MAX_WAIT:
+            return response
+        print(f"Rate limited on {url}, retrying in {wait:.0f}s")
+        limiter.block_for(wait)
+    return response
+
+def _cached_response(url, body):
+    import requests
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = body
+    response.encoding = "utf-8"
+    response.headers["X-Cache"] = "HIT"
+    return response
+
+def request(method, path, priority=None, cache_ttl=None, **kwargs):
+    """
+    Send an authenticated request to the Strava API. `path` is relative to
+    API_BASE (e.g. "/athlete/activities"). Requests are paced against the
+    rate budget; writes default to PRIORITY_HIGH, reads to PRIORITY_NORMAL.
+    Tokens come from the shared token store; on a 401 the token is
+    refreshed once and the request retried.
+
+    GETs with `cache_ttl` (seconds) are served from the response cache while
+    fresh and revalidated with If-None-Match once stale. Any write to a URL
+    drops its cached responses.
+    """
+    url = path if path.startswith("http") else f"{API_BASE}{path}"
+    if priority is None:
+        priority = PRIORITY_NORMAL if method == "GET" else PRIORITY_HIGH
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    extra_headers = dict(kwargs.pop("headers", None) or {})
+
+    cache_key = cached = None
+    if cache_ttl is not None and method == "GET":
+        cache_key = response_cache.make_key(url, kwargs.get("params"))
+        cached = response_cache.lookup(cache_key)
+        if cached and time.time() - cached["fetched_at"] < cache_ttl:
+            metrics.inc("strava_api_cache_total", result="hit")
+            return _cached_response(url, cached["body"])
+        if cached and cached["etag"]:
+            extra_headers["If-None-Match"] = cached["etag"]
+
+    def send(token):
+        headers = {"Authorization": f"Bearer {token}"}
+        headers.update(extra_headers)
+        return _send_paced(method, url, priority, headers=headers, **kwargs)
+
+    token = get_access_token()
+    response = send(token)
+    if response.status_code == 401:
+        print("Access token rejected! Refreshing...")
+        new_token = refresh_access_token(token)
+        if new_token and new_token != token:
+            response = send(new_token)
+
+    if cache_key is not None:
+        if response.status_code == 304 and cached:
+            metrics.inc("strava_api_cache_total", result="revalidated")
+            response_cache.mark_fresh(cache_key)
+            return _cached_response(url, cached["body"])
+        if response.status_code == 200:
+            metrics.inc("strava_api_cache_total", result="miss")
+            response_cache.store(cache_key, url, response.headers.get("ETag"), response.content)
+    elif method != "GET":
+        response_cache.invalidate(url)
+    return response
+
+def get(path, **kwargs):
+    return request("GET", path, **kwargs)
+
+def put(path, **kwargs):
+    return request("PUT", path, **kwargs)
+
+def post(path, **kwargs):
+    return request("POST", path, **kwargs)
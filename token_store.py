@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; fall back to the thread lock only
+    fcntl = None
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# Shared by strava.py and strava_abs.py so a rotated refresh token is never lost
+TOKEN_PATH = os.getenv("STRAVA_TOKEN_PATH", "strava_token.json")
+LOCK_PATH = TOKEN_PATH + ".lock"
+
+# Refresh this many seconds before the access token expires
+REFRESH_MARGIN = 300
+
+_thread_lock = threading.Lock()
+
+def _seed_from_env():
+    return {
+        "access_token": os.getenv("STRAVA_ACCESS_TOKEN"),
+        "refresh_token": os.getenv("STRAVA_REFRESH_TOKEN"),
+        # Unknown expiry: treat as expired so the first run refreshes once
+        "expires_at": int(os.getenv("STRAVA_TOKEN_EXPIRES_AT", "0")),
+    }
+
+def load_tokens():
+    """Read the stored tokens, seeding them from .env on first use."""
+    try:
+        with open(TOKEN_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return _seed_from_env()
+    except (OSError, ValueError) as e:
+        print(f"Could not read token store {TOKEN_PATH}: {e}")
+        return _seed_from_env()
+
+def save_tokens(tokens):
+    """Write the tokens atomically, readable by the owner only."""
+    tmp_path = f"{TOKEN_PATH}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(tokens, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, TOKEN_PATH)
+
+def is_expiring(tokens, margin=REFRESH_MARGIN):
+    return tokens.get("expires_at", 0) - time.time() <= margin
+
+@contextmanager
+def locked():
+    """Exclusive lock across threads and processes for the refresh critical section."""
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(LOCK_PATH, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# File spans are appended to (unset: tracing off; `--trace <file>` on the
+# scripts overrides it). Chrome trace event format, one event per line;
+# open it in ui.perfetto.dev or chrome://tracing.
+TRACE_PATH = os.getenv("TRACE_PATH")
+# Buffered events are written when a top-level span ends or the buffer fills
+FLUSH_EVENTS = 1000
+
+_path = TRACE_PATH
+_lock = threading.Lock()
+_events = []
+_named_threads = set()
+_local = threading.local()
+# perf_counter_ns -> wall-clock microseconds, so runs appended to one file line up
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+# --- SPANS ---
+class _NoSpan:
+    """What span() returns while tracing is off: a shared object that does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+NO_SPAN = _NoSpan()
+
+class Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        _local.depth = getattr(_local, "depth", 0) + 1
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        _local.depth -= 1
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        _record(self.name, self.start, end, self.args, flush=_local.depth == 0)
+        return False
+
+    def set(self, **args):
+        """Attach arguments learned inside the span (e.g. a status code)."""
+        self.args.update(args)
+
+def span(name, **args):
+    """
+    Time the block as a span called `name`; nested spans nest in the viewer.
+    With tracing off this returns NO_SPAN and costs one function call.
+    """
+    if _path is None:
+        return NO_SPAN
+    return Span(name, args)
+
+def enable(path):
+    global _path
+    _path = path
+
+def take_trace_flag(argv):
+    """Strip `--trace <file>` from a script's argv, turning tracing on; returns the rest."""
+    if "--trace" not in argv:
+        return argv
+    index = argv.index("--trace")
+    if index + 1 >= len(argv):
+        sys.exit("--trace needs a file to write spans to")
+    enable(argv[index + 1])
+    return argv[:index] + argv[index + 2:]
+
+def enabled():
+    return _path is not None
+
+# --- EXPORT ---
+def _record(name, start, end, args, flush):
+    thread = threading.current_thread()
+    event = {
+        "name": name, "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+        "ts": (start + _EPOCH_OFFSET_NS) // 1000, "dur": (end - start) // 1000,
+    }
+    if args:
+        event["args"] = args
+    with _lock:
+        if thread.ident not in _named_threads:
+            _named_threads.add(thread.ident)
+            _events.append({"name": "thread_name", "ph": "M", "pid": event["pid"], "tid": thread.ident,
+                            "args": {"name": thread.name}})
+        _events.append(event)
+        if not flush and len(_events) < FLUSH_EVENTS:
+            return
+        pending = _events[:]
+        _events.clear()
+        _write(pending)
+
+def _write(events):
+    # JSON array format without the closing bracket, which trace viewers
+    # accept; each line is one event followed by a comma
+    lines = "".join(json.dumps(e, default=str) + ",\n" for e in events)
+    try:
+        with open(_path, "a") as f:
+            if f.tell() == 0:
+                lines = "[\n" + lines
+            f.write(lines)
+    except OSError as e:
+        print(f"Could not write trace: {e}")
+
+def flush():
+    with _lock:
+        if _events and _path is not None:
+            _write(_events[:])
+        _events.clear()
+
+atexit.register(flush)
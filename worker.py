@@ -0,0 +1,219 @@
+import os
+import sys
+import time
+import heapq
+import queue
+import signal
+import threading
+from dotenv import load_dotenv
+
+import strava_client
+import activity_store
+import metrics
+
+load_dotenv()
+
+# --- CONFIGURATION ---
+# Seconds between runs of each periodic job; 0 disables the job
+WORKER_SEGMENT_INTERVAL = int(os.getenv("WORKER_SEGMENT_INTERVAL", "60"))
+WORKER_ACTIVITY_INTERVAL = int(os.getenv("WORKER_ACTIVITY_INTERVAL", "300"))
+WORKER_ABS_INTERVAL = int(os.getenv("WORKER_ABS_INTERVAL", "900"))
+
+# sync_state key holding the last activity strava_abs annotated
+ABS_MARKER_KEY = "abs_last_annotated"
+
+# --- JOB QUEUE ---
+class JobQueue:
+    """
+    Jobs run one at a time on a single thread, in submission order; they
+    share the module-level HTTP session, token store and DB connections.
+    A job whose name is already queued or running is not queued again, so
+    a slow run never piles up copies of itself. With `while_running` only a
+    queued copy counts: the job runs again after the current run.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._running = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, name, func, *args, while_running=False):
+        with self._lock:
+            if name in self._queued or (name == self._running and not while_running):
+                return False
+            self._queued.add(name)
+        self._queue.put((name, func, args))
+        return True
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            name, func, args = job
+            with self._lock:
+                self._queued.discard(name)
+                self._running = name
+            # Per-activity push jobs share one label
+            kind = name.split("-")[0] if name.startswith("activity-") else name
+            started = time.monotonic()
+            result = "ok"
+            try:
+                func(*args)
+            except Exception as e:
+                result = "error"
+                print(f"Job {name} failed: {e}")
+            finally:
+                with self._lock:
+                    self._running = None
+            elapsed = time.monotonic() - started
+            metrics.observe("strava_worker_job_seconds", elapsed, job=kind)
+            metrics.inc("strava_worker_jobs_total", job=kind, result=result)
+            print(f"Job {name} finished in {elapsed:.1f}s")
+
+    def stop(self, timeout=None):
+        """Finish the running job and whatever is already queued, then exit."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+class Scheduler:
+    """Submits periodic jobs to a JobQueue on fixed intervals (monotonic clock)."""
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self._heap = []
+
+    def every(self, interval, name, func, *args):
+        if interval > 0:
+            heapq.heappush(self._heap, (time.monotonic(), name, interval, func, args))
+
+    def run(self, stop_event):
+        while self._heap and not stop_event.is_set():
+            due, name, interval, func, args = self._heap[0]
+            wait = due - time.monotonic()
+            if wait > 0:
+                stop_event.wait(wait)
+                continue
+            heapq.heapreplace(self._heap, (max(due + interval, time.monotonic()), name, interval, func, args))
+            self.jobs.submit(name, func, *args)
+
+# --- JOBS ---
+class SegmentPoller:
+    """Segment polls on one long-lived connection, with background webhook delivery."""
+    def __init__(self, segment_ids):
+        import segment_monitor
+        self.monitor = segment_monitor
+        self.segment_ids = list(dict.fromkeys(segment_ids))
+        self.conn = None
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.delivery = threading.Thread(
+            target=segment_monitor.delivery_worker, args=(self.stop_event, self.wake_event),
+            name="webhook-delivery", daemon=True
+        )
+
+    def poll(self):
+        # Opened on the job thread, which is the only one that uses it
+        if self.conn is None:
+            self.conn = self.monitor.init_segment_db()
+            self.delivery.start()
+        if self.monitor.poll_round(self.conn, self.segment_ids):
+            self.wake_event.set()
+
+    def close(self):
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.delivery.is_alive():
+            self.delivery.join(timeout=10)
+        if self.conn is not None:
+            self.conn.close()
+
+def process_recent_activities():
+    import strava
+    recent_activities = strava.get_recent_activities()
+    strava.process_batch([activity["id"] for activity in recent_activities])
+
+def annotate_latest_activity():
+    """strava_abs for the newest activity, once it has been annotated successfully."""
+    import strava_abs
+    last_activity = strava_abs.get_last_activity()
+    if not last_activity:
+        return
+    if activity_store.get_sync_value(ABS_MARKER_KEY) == str(last_activity["id"]):
+        return
+    if strava_abs.annotate_activity(last_activity):
+        activity_store.set_sync_value(ABS_MARKER_KEY, str(last_activity["id"]))
+
+# --- MAIN ---
+def run_worker(segment_ids, push_port=None, stop_event=None):
+    """
+    Run the periodic jobs (and, with `push_port`, the push receiver) until
+    SIGINT/SIGTERM or `stop_event`. Shutdown lets the running job finish.
+    """
+    import strava
+    strava.require_save_path()
+    stop_event = stop_event or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda signum, frame: stop_event.set())
+
+    jobs = JobQueue()
+    poller = SegmentPoller(segment_ids)
+    scheduler = Scheduler(jobs)
+    scheduler.every(WORKER_SEGMENT_INTERVAL, "segments", poller.poll)
+    scheduler.every(WORKER_ACTIVITY_INTERVAL, "recent-activities", process_recent_activities)
+    scheduler.every(WORKER_ABS_INTERVAL, "abs-annotation", annotate_latest_activity)
+
+    server = None
+    if push_port is not None:
+        import push_receiver
+
+        def enqueue_activity(activity_id):
+            # An update arriving while the activity is processed may postdate
+            # the details that run fetched, so it runs again afterwards
+            jobs.submit(f"activity-{activity_id}", strava.process_activity, activity_id, while_running=True)
+
+        server, push_queue, push_worker = push_receiver.make_server(enqueue_activity, port=push_port)
+        push_worker.start()
+        threading.Thread(target=server.serve_forever, name="push-receiver", daemon=True).start()
+        print(f"Listening for Strava push events on port {server.server_port}")
+
+    print(f"Worker started: segments {poller.segment_ids} every {WORKER_SEGMENT_INTERVAL}s, "
+          f"activities every {WORKER_ACTIVITY_INTERVAL}s, ABS every {WORKER_ABS_INTERVAL}s")
+    jobs.start()
+    metrics.dump_every("worker", metrics.METRICS_INTERVAL, stop_event)
+    try:
+        scheduler.run(stop_event)
+        stop_event.wait()
+    finally:
+        print("Worker stopping...")
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            push_queue.stop()
+            push_worker.join()
+        # The segment connection belongs to the job thread; close it there
+        jobs.submit("shutdown", poller.close)
+        jobs.stop()
+        strava_client.close_session()
+        metrics.dump("worker")
+        print("Worker stopped.")
+
+def main(argv=None):
+    """worker.py [--push] [segment_id ...]; --push also receives push events on PUSH_PORT"""
+    argv = sys.argv[1:] if argv is None else argv
+    push_port = None
+    if argv and argv[0] == "--push":
+        import push_receiver
+        push_port = push_receiver.PUSH_PORT
+        argv = argv[1:]
+    import segment_monitor
+    import strava
+    segment_ids = [int(a) for a in argv] or segment_monitor.SEGMENT_IDS or [strava.BIG_SEGMENT_ID]
+    run_worker(segment_ids, push_port)
+
+if __name__ == "__main__":
+    main()